@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+
+"""
+benchmark.py - time the offline code paths against synthetic large projects
+
+A github tree in the real data/github/<org>/<repo>/<n>_issue.json layout and a set
+of matching jira search payloads are generated in a scratch directory, then the
+steps that scale with the size of a project are timed there:
+
+    map_logins.main, JiraWrapper.load_github_data, building the jira index and
+    matching every labeled issue against it, the migration plan, and the link
+    parsing and page merging of the crawler.
+
+The timings are written as json so runs of different versions can be compared.
+
+    python benchmark.py --issues 10000 100000 --output benchmark_results.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+from logzero import logger
+
+
+ORGS = ['bench-org']
+REPOS = ['bench-backend', 'bench-frontend', 'bench-installer', 'bench-docs']
+LOGINS = 500
+
+
+@contextlib.contextmanager
+def chdir(path):
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode('utf-8').strip()
+    except Exception:
+        return None
+
+
+def timestamp(rnd):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(rnd.randint(1420070400, 1640995200)))
+
+
+def make_issue(rnd, org, repo, number, ncomments, label_ratio):
+    api = f'https://api.github.com/repos/{org}/{repo}'
+    labels = [{'name': rnd.choice(['bug', 'enhancement', 'question', 'docs'])}]
+    if rnd.random() < label_ratio:
+        labels.append({'name': 'JIRA'})
+    created_at = timestamp(rnd)
+    issue = {
+        'url': f'{api}/issues/{number}',
+        'repository_url': api,
+        'comments_url': f'{api}/issues/{number}/comments',
+        'html_url': f'https://github.com/{org}/{repo}/issues/{number}',
+        'number': number,
+        'title': f'synthetic issue {number}',
+        'body': 'lorem ipsum dolor sit amet ' * rnd.randint(1, 40),
+        'user': {'login': f'user{rnd.randrange(LOGINS)}'},
+        'labels': labels,
+        'state': 'open',
+        'comments': ncomments,
+        'created_at': created_at,
+        'updated_at': created_at
+    }
+    if rnd.random() < 0.3:
+        issue['pull_request'] = {'url': f'{api}/pulls/{number}'}
+    return issue
+
+
+def make_comment(rnd, issue, idx):
+    return {
+        'html_url': issue['html_url'] + f'#issuecomment-{issue["number"] * 1000 + idx}',
+        'user': {'login': f'user{rnd.randrange(LOGINS)}'},
+        'created_at': timestamp(rnd),
+        'body': 'consectetur adipiscing elit ' * rnd.randint(1, 20)
+    }
+
+
+def generate(workdir, issues, comments, label_ratio, migrated_ratio, seed=0):
+    '''Write the github tree and jira search pages, returns what was written'''
+    rnd = random.Random(seed)
+    tickets = []
+    ncomments = 0
+
+    for idx in range(issues):
+        org = ORGS[idx % len(ORGS)]
+        repo = REPOS[idx % len(REPOS)]
+        number = idx // len(REPOS) + 1
+        bd = os.path.join(workdir, 'data', 'github', org, repo)
+        if not os.path.exists(bd):
+            os.makedirs(bd)
+
+        # exponentially distributed, so a few issues carry most of the comments
+        count = int(rnd.expovariate(1.0 / comments)) if comments else 0
+        issue = make_issue(rnd, org, repo, number, count, label_ratio)
+        cdata = [make_comment(rnd, issue, x) for x in range(count)]
+        ncomments += count
+
+        with open(os.path.join(bd, f'{number}_issue.json'), 'w') as f:
+            f.write(json.dumps(issue))
+        with open(os.path.join(bd, f'{number}_comments.json'), 'w') as f:
+            f.write(json.dumps(cdata))
+
+        if any(x['name'] == 'JIRA' for x in issue['labels']) and rnd.random() < migrated_ratio:
+            key = f'AA-{len(tickets) + 1}'
+            posted = cdata[:rnd.randint(0, len(cdata))]
+            tickets.append({
+                'key': key,
+                'self': f'https://issues.redhat.com/rest/api/2/issue/{key}',
+                'fields': {
+                    'description': issue['html_url'] + '\n\n' + issue['body'],
+                    'comment': {
+                        'total': len(posted),
+                        'comments': [{'body': x['html_url'] + '\n' + x['body']} for x in posted]
+                    }
+                }
+            })
+
+    jd = os.path.join(workdir, 'data', 'jira', 'search')
+    os.makedirs(jd)
+    pages = [tickets[x:x + 100] for x in range(0, len(tickets), 100)] or [[]]
+    for idx, page in enumerate(pages):
+        with open(os.path.join(jd, f'{idx:05d}.json'), 'w') as f:
+            f.write(json.dumps({'startAt': idx * 100, 'maxResults': 100, 'total': len(tickets), 'issues': page}))
+
+    return {'issues': issues, 'comments': ncomments, 'tickets': len(tickets)}
+
+
+def load_search_pages(workdir):
+    jd = os.path.join(workdir, 'data', 'jira', 'search')
+    for fn in sorted(os.listdir(jd)):
+        with open(os.path.join(jd, fn), 'r') as f:
+            yield json.loads(f.read())
+
+
+def link_header(url, page, last):
+    links = []
+    if page < last:
+        links.append(f'<{url}?per_page=100&page={page + 1}>; rel="next"')
+        links.append(f'<{url}?per_page=100&page={last}>; rel="last"')
+    if page > 1:
+        links.append(f'<{url}?per_page=100&page=1>; rel="first"')
+        links.append(f'<{url}?per_page=100&page={page - 1}>; rel="prev"')
+    return ', '.join(links)
+
+
+def run(workdir, issues, comments, label_ratio, migrated_ratio):
+    # the scripts work on paths relative to the current directory
+    from github_tickets import GHCrawler
+    from issue_store import repo_from_url
+    from jira_index import CommentIndex, JiraIndex
+    from jira_tickets import JiraWrapper
+    from migration_journal import MigrationJournal
+    from migration_plan import build_plan
+    import map_logins
+
+    timings = {}
+
+    def timed(name, func, *args, **kwargs):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings[name] = round(time.perf_counter() - started, 4)
+        logger.info(f'{name}: {timings[name]:.2f}s')
+        return result
+
+    sizes = timed('generate', generate, workdir, issues, comments, label_ratio, migrated_ratio)
+
+    with chdir(workdir):
+        # the first run imports every file into the store, the second only stats them
+        timed('map_logins.main.cold', map_logins.main)
+        timed('map_logins.main.warm', map_logins.main)
+
+        jw = JiraWrapper.__new__(JiraWrapper)
+        timed('load_github_data', jw.load_github_data)
+        sizes['labeled'] = len(jw.github_issues)
+
+        pages = list(load_search_pages(workdir))
+
+        def _index():
+            jira_index = JiraIndex()
+            comment_index = CommentIndex()
+            for page in pages:
+                for ji in page['issues']:
+                    jira_index.add(jw.make_jira_record(ji))
+                    comment_index.add_bodies(ji['key'], [x['body'] for x in ji['fields']['comment']['comments']])
+            return jira_index, comment_index
+        jira_index, comment_index = timed('jira_index.build', _index)
+
+        def _match():
+            found = 0
+            for gi in jw.github_issues:
+                idata = jw.store.get_issue(repo_from_url(gi[1]), gi[2])
+                if jira_index.get(idata['html_url']):
+                    found += 1
+            return found
+        sizes['matched'] = timed('jira_index.match', _match)
+
+        journal = MigrationJournal(os.path.join('data', 'jira', 'migration_journal.jsonl'))
+        plan = timed('migration_plan.build_plan', build_plan, jw.store, jira_index, comment_index, journal)
+        journal.close()
+        sizes['planned_comments'] = sum(len(x['comments']) for x in plan['comment'])
+        jw.store.close()
+
+    url = 'https://api.github.com/repositories/1/issues'
+    last = max(1, issues // 100)
+    headers = [link_header(url, x, last) for x in range(1, last + 1)]
+
+    def _cleanlinks():
+        for header in headers:
+            if header:
+                GHCrawler.cleanlinks(header)
+    timed('GHCrawler.cleanlinks', _cleanlinks)
+
+    items = [{'number': x, 'title': f'synthetic issue {x}'} for x in range(issues)]
+    listing = [items[x:x + 100] for x in range(0, len(items), 100)]
+    timed('GHCrawler.merge_pages', GHCrawler.merge_pages, listing)
+
+    return {'sizes': sizes, 'timings': timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='time the offline code paths on synthetic projects')
+    parser.add_argument('--issues', type=int, nargs='+', default=[10000], help='project sizes to run')
+    parser.add_argument('--comments', type=float, default=10, help='average comments per issue')
+    parser.add_argument('--label-ratio', type=float, default=0.05, help='share of issues labeled JIRA')
+    parser.add_argument('--migrated-ratio', type=float, default=0.5, help='share of labeled issues with a ticket')
+    parser.add_argument('--workdir', help='where to generate the data (default: a temporary directory)')
+    parser.add_argument('--keep', action='store_true', help='keep the generated data')
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'params': {
+            'comments': args.comments,
+            'label_ratio': args.label_ratio,
+            'migrated_ratio': args.migrated_ratio
+        },
+        'runs': []
+    }
+
+    for issues in args.issues:
+        workdir = tempfile.mkdtemp(prefix=f'bench-{issues}-', dir=args.workdir)
+        logger.info(f'benchmarking {issues} issues in {workdir}')
+        try:
+            results['runs'].append(
+                run(workdir, issues, args.comments, args.label_ratio, args.migrated_ratio)
+            )
+        finally:
+            if not args.keep:
+                shutil.rmtree(workdir)
+
+    with open(args.output, 'w') as f:
+        f.write(json.dumps(results, indent=2, sort_keys=True))
+    logger.info(f'wrote {args.output}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+"""
+form_fill.py - fill the jira create and comment forms with a few execute_script calls
+
+Typing into the aui widgets with send_keys costs a webdriver round trip per key
+press batch and trips the @mention autocomplete on long bodies. These helpers set
+the hidden form controls the widgets are backed by directly, fire the events jira
+listens for and read the resulting state back so it can be checked.
+"""
+
+
+COMMON_JS = '''
+function setValue(el, value) {
+    el.value = value;
+    el.dispatchEvent(new Event('input', {bubbles: true}));
+    el.dispatchEvent(new Event('change', {bubbles: true}));
+}
+function selectByText(sel, texts, partial) {
+    var found = [];
+    Array.prototype.forEach.call(sel.options, function(opt) {
+        var text = opt.text.trim();
+        opt.selected = texts.some(function(t) { return partial ? text.indexOf(t) > -1 : text === t; });
+        if (opt.selected) { found.push(text); }
+    });
+    sel.dispatchEvent(new Event('change', {bubbles: true}));
+    return found;
+}
+function fieldGroupInput(label) {
+    var groups = document.querySelectorAll('.field-group');
+    for (var i = 0; i < groups.length; i++) {
+        var lbl = groups[i].querySelector('label');
+        if (lbl && lbl.textContent.indexOf(label) > -1) {
+            return groups[i].querySelector('input, textarea');
+        }
+    }
+    return null;
+}
+function selectedTexts(sel) {
+    if (!sel) { return null; }
+    return Array.prototype.filter.call(sel.options, function(o) { return o.selected; })
+        .map(function(o) { return o.text.trim(); });
+}
+'''
+
+SET_ISSUE_TYPE_JS = COMMON_JS + '''
+var sel = document.getElementById('issuetype');
+if (!sel) { return 'missing'; }
+var current = selectedTexts(sel);
+if (current.length && current[0] === arguments[0]) { return 'same'; }
+return selectByText(sel, [arguments[0]]).length ? 'changed' : 'unknown';
+'''
+
+FILL_CREATE_FORM_JS = COMMON_JS + '''
+var f = arguments[0];
+var missing = [];
+
+var rte = document.querySelector('#description-wiki-edit .rte-container');
+if (rte) { rte.parentNode.removeChild(rte); }
+
+['summary', 'description'].forEach(function(id) {
+    var el = document.getElementById(id);
+    if (el) { setValue(el, f[id]); } else { missing.push(id); }
+});
+
+var components = document.getElementById('components');
+if (components) {
+    if (selectByText(components, f.components).length !== f.components.length) { missing.push('components'); }
+} else if (f.components.length) {
+    missing.push('components');
+}
+
+if (f.security) {
+    var security = document.getElementById('security');
+    if (!security || !selectByText(security, [f.security], true).length) { missing.push('security'); }
+}
+
+if (f.epic_name) {
+    var epic = fieldGroupInput('Epic Name');
+    if (epic) { setValue(epic, f.epic_name); } else { missing.push('epic_name'); }
+}
+
+// the user picker is backed by a single select, giving it the already
+// resolved user skips the autocomplete round trips altogether
+if (f.reporter) {
+    var reporter = document.getElementById('reporter');
+    if (reporter) {
+        var opt = Array.prototype.find.call(reporter.options, function(o) { return o.value === f.reporter.name; });
+        if (!opt) {
+            opt = new Option(f.reporter.display || f.reporter.name, f.reporter.name);
+            reporter.appendChild(opt);
+        }
+        Array.prototype.forEach.call(reporter.options, function(o) { o.selected = o === opt; });
+        reporter.dispatchEvent(new Event('change', {bubbles: true}));
+        var field = document.getElementById('reporter-field');
+        if (field) { setValue(field, f.reporter.display || f.reporter.name); }
+    } else {
+        missing.push('reporter');
+    }
+}
+
+return missing;
+'''
+
+READ_CREATE_FORM_JS = COMMON_JS + '''
+var epic = fieldGroupInput('Epic Name');
+var summary = document.getElementById('summary');
+var description = document.getElementById('description');
+var reporter = document.getElementById('reporter');
+return {
+    issuetype: selectedTexts(document.getElementById('issuetype')),
+    summary: summary ? summary.value : null,
+    description: description ? description.value : null,
+    components: selectedTexts(document.getElementById('components')),
+    security: selectedTexts(document.getElementById('security')),
+    epic_name: epic ? epic.value : null,
+    reporter: reporter ? reporter.value : null
+};
+'''
+
+FILL_COMMENT_JS = COMMON_JS + '''
+var missing = [];
+var rte = document.querySelector('#comment-wiki-edit .rte-container');
+if (rte) { rte.parentNode.removeChild(rte); }
+var comment = document.querySelector('#comment-wiki-edit textarea#comment');
+if (comment) { setValue(comment, arguments[0]); } else { missing.push('comment'); }
+if (arguments[1]) {
+    var level = document.getElementById('commentLevel');
+    if (!level || !selectByText(level, [arguments[1]], true).length) { missing.push('commentLevel'); }
+}
+return missing;
+'''
+
+
+def set_issue_type(driver, itype):
+    '''Returns "changed" when jira will reload the form for the new type'''
+    return driver.execute_script(SET_ISSUE_TYPE_JS, itype)
+
+
+def fill_create_form(driver, fields):
+    '''Set summary, description, components, security, epic name and reporter, returns the fields not found'''
+    return driver.execute_script(FILL_CREATE_FORM_JS, fields)
+
+
+def read_create_form(driver):
+    return driver.execute_script(READ_CREATE_FORM_JS)
+
+
+def check_create_form(state, fields, itype):
+    '''The names of the fields whose state differs from what was asked for'''
+    wrong = []
+    if not state['issuetype'] or state['issuetype'][0] != itype:
+        wrong.append('issuetype')
+    for key in ('summary', 'description'):
+        # browsers normalize the line endings of textareas
+        if (state[key] or '').replace('\r\n', '\n') != fields[key].replace('\r\n', '\n'):
+            wrong.append(key)
+    if sorted(state['components'] or []) != sorted(fields['components']):
+        wrong.append('components')
+    if fields.get('security') and not any(fields['security'] in x for x in state['security'] or []):
+        wrong.append('security')
+    if fields.get('epic_name') and state['epic_name'] != fields['epic_name']:
+        wrong.append('epic_name')
+    # a missing reporter field (no permission to set it) is reported by the fill already
+    if fields.get('reporter') and state.get('reporter') not in (None, fields['reporter']['name']):
+        wrong.append('reporter')
+    return wrong
+
+
+def fill_comment(driver, body, security_level=None):
+    '''Set the comment text (and visibility), returns the fields not found'''
+    return driver.execute_script(FILL_COMMENT_JS, body, security_level)
@@ -1,17 +1,44 @@
 #!/usr/bin/env python
 
-import json
+"""
+github_ticket_close.py - comment on and close the github issues that were migrated to jira
+
+The candidates are the close list of the migration plan (see migration_plan.py),
+computed afresh or read from a saved plan.json with --from-plan. The state of every
+candidate issue is checked up front with batched graphql queries (falling back to
+the crawled data), then the still open ones are commented on and closed by a small
+pool of workers. Writes are paced to stay under github's secondary rate limits for
+content creation.
+"""
+
+import argparse
 import os
-import random
-import requests
-import requests_cache
+import threading
 import time
 
-import timeout_decorator
+from concurrent.futures import ThreadPoolExecutor
+
 from logzero import logger
-from pprint import pprint
 
-from github import Github
+import metrics
+
+from github_tickets import TokenScheduler, send_on_token
+from http_client import get_client
+from issue_store import IssueStore
+from migration_journal import MigrationJournal
+from migration_plan import PLAN_FILE, github_issue_from_url, load_plan, make_plan, save_plan
+
+
+GRAPHQL_URL = 'https://api.github.com/graphql'
+
+# issues per graphql state query
+GRAPHQL_BATCH = 50
+
+# how many issues are commented on and closed at the same time
+CLOSE_WORKERS = int(os.environ.get('GITHUB_CLOSE_WORKERS', 4))
+
+# github asks for no more than 80 content creating requests per minute
+WRITES_PER_MINUTE = int(os.environ.get('GITHUB_WRITES_PER_MINUTE', 80))
 
 
 def get_headers(token):
@@ -21,44 +48,160 @@ def get_headers(token):
     }
 
 
-def main():
-
-    token = os.environ.get('GITHUB_TOKEN')
-    g = Github(token)
+class WritePacer(object):
+
+    '''Space out content creating requests evenly across all workers'''
+
+    def __init__(self, per_minute=WRITES_PER_MINUTE):
+        self.interval = 60.0 / per_minute if per_minute else 0
+        self.lock = threading.Lock()
+        self.next_slot = 0
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            metrics.inc('github_write_pacing_seconds_total', slot - now)
+            time.sleep(slot - now)
+
+
+def github_request(client, scheduler, method, url, **kwargs):
+    return send_on_token(
+        scheduler,
+        lambda token: client.request(method, url, headers=get_headers(token), **kwargs),
+        url
+    )
+
+
+def fetch_states(client, scheduler, github_urls, batch_size=GRAPHQL_BATCH):
+    '''The state (open/closed) of each github issue url, looked up batch_size issues per query'''
+    states = {}
+    urls = [x for x in github_urls if github_issue_from_url(x)[0]]
+    for idb in range(0, len(urls), batch_size):
+        batch = urls[idb:idb + batch_size]
+
+        # one aliased repository block per repo, one aliased issue per url
+        repos = {}
+        for url in batch:
+            repo, number = github_issue_from_url(url)
+            repos.setdefault(repo, []).append((number, url))
+
+        aliases = {}
+        blocks = []
+        for idr, (repo, issues) in enumerate(sorted(repos.items())):
+            owner, name = repo.split('/')
+            fields = []
+            for idi, (number, url) in enumerate(issues):
+                aliases[(f'r{idr}', f'i{idi}')] = url
+                fields.append(
+                    f'i{idi}: issueOrPullRequest(number: {number}) '
+                    '{ ... on Issue { state } ... on PullRequest { state } }'
+                )
+            blocks.append(f'r{idr}: repository(owner: "{owner}", name: "{name}") {{ {" ".join(fields)} }}')
+        query = 'query { ' + ' '.join(blocks) + ' }'
+
+        rr = github_request(client, scheduler, 'POST', GRAPHQL_URL, json={'query': query})
+        if rr.status_code != 200:
+            logger.error(f'graphql state query failed with {rr.status_code}')
+            continue
+        jdata = rr.json()
+        for error in jdata.get('errors') or []:
+            logger.warning(error.get('message'))
+        data = jdata.get('data') or {}
+        for (ra, ia), url in aliases.items():
+            issue = (data.get(ra) or {}).get(ia)
+            if issue and issue.get('state'):
+                states[url] = issue['state'].lower()
 
-    with open('data/jira/AA_jira_tickets.json', 'r') as f:
-        jtickets = json.loads(f.read())
+    return states
 
-    for jticket in jtickets:
-        if not jticket.get('github_link'):
-            continue
-        pprint(jticket)
 
-        reponame = '/'.join(jticket['github_link'].split('/')[3:5])
+def close_issue(client, scheduler, pacer, journal, jticket):
+    gurl = jticket['github_link'].replace('github.com/', 'api.github.com/repos/')
+    logger.info(f"closing {jticket['github_link']} -> {jticket['number']}")
 
-        try:
-            number = int(jticket['github_link'].split('/')[-1])
-        except Exception as e:
-            logger.error(e)
-            import epdb; epdb.st()
+    with metrics.timer('github_close_seconds'):
+        pacer.wait()
+        rr = github_request(
+            client,
+            scheduler,
+            'POST',
+            gurl + '/comments',
+            json={'body': f"migrated to {jticket['url']}"}
+        )
+        rr.raise_for_status()
 
-        gurl = jticket['github_link']
-        gurl = gurl.replace('github.com/', 'api.github.com/repos/')
+        pacer.wait()
+        rr = github_request(client, scheduler, 'PATCH', gurl, json={'state': 'closed'})
+        rr.raise_for_status()
 
-        logger.info(gurl)
-        rr = requests.get(gurl, headers=get_headers(token))
-        idata = rr.json()
-        if idata['state'] == 'closed':
-            continue
+    journal.ticket_closed(jticket['github_link'], jticket['number'])
+    metrics.inc('github_closed_total')
 
-        repo = g.get_repo(reponame)
-        issue = repo.get_issue(number)
-        issue.create_comment(f"migrated to {jticket['url']}")
-        time.sleep(1)
-        issue.edit(state='closed')
-        #import epdb; epdb.st()
-        time.sleep(2)
 
+def main():
+    parser = argparse.ArgumentParser(description='comment on and close the github issues migrated to jira')
+    parser.add_argument('--plan-file', default=PLAN_FILE)
+    parser.add_argument(
+        '--from-plan',
+        action='store_true',
+        help='close what the saved plan file lists instead of computing a new plan'
+    )
+    args = parser.parse_args()
+
+    if args.from_plan:
+        plan = load_plan(args.plan_file)
+    else:
+        plan = make_plan()
+        save_plan(plan, args.plan_file)
+
+    tokens = os.environ.get('GITHUB_TOKENS', os.environ.get('GITHUB_TOKEN', '')).split(',')
+    scheduler = TokenScheduler([x for x in tokens if x])
+    client = get_client()
+
+    # the planned tickets, minus what got closed since the plan was made ...
+    journal = MigrationJournal()
+    jtickets = [
+        {'github_link': x['github_url'], 'number': x['jira_key'], 'url': x['jira_url']}
+        for x in plan['close'] if not journal.is_closed(x['github_url'])
+    ]
+    logger.info(f'{len(jtickets)} migrated issues not known to be closed')
+
+    states = fetch_states(client, scheduler, [x['github_link'] for x in jtickets])
+
+    # anything graphql could not tell falls back to what the crawl saw
+    store = IssueStore()
+    store.import_tree()
+
+    todo = []
+    for jticket in jtickets:
+        state = states.get(jticket['github_link'])
+        if state is None:
+            repo, number = github_issue_from_url(jticket['github_link'])
+            idata = store.get_issue(repo, number) if repo else None
+            state = idata.get('state') if idata else None
+        # merged pull requests count as closed too
+        if state is not None and state != 'open':
+            journal.ticket_closed(jticket['github_link'], jticket['number'])
+            continue
+        todo.append(jticket)
+    store.close()
+
+    logger.info(f'closing {len(todo)} issues with {CLOSE_WORKERS} workers')
+    pacer = WritePacer()
+    with ThreadPoolExecutor(max_workers=max(1, CLOSE_WORKERS)) as executor:
+        futures = [executor.submit(close_issue, client, scheduler, pacer, journal, x) for x in todo]
+        for jticket, future in zip(todo, futures):
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"failed to close {jticket['github_link']}: {e}")
+                metrics.inc('github_close_failures_total')
+
+    journal.close()
+    metrics.export('github_close')
 
 
 if __name__ == "__main__":
@@ -1,25 +1,250 @@
 #!/usr/bin/env python
 
+import collections
+import itertools
 import json
 import os
-import random
-import requests
-import requests_cache
+import queue
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
-import timeout_decorator
 from logzero import logger
 
-# setup requests cache ...
+import metrics
+
+from http_cache import HTTPCache
+from http_client import HTTPClient, HTTPRetriesExhausted, get_client
+from issue_store import IssueStore, repo_from_url
+from repo_config import RepoConfig
+
 DATA_DIR = 'data/github'
 if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR)
-requests_cache.install_cache(os.path.join(DATA_DIR, '.github_requests_cache'))
+
+# validators and watermarks from previous runs ...
+SYNC_STATE_FILE = os.path.join(DATA_DIR, '.sync_state.json')
+
+# how many issues to process at the same time
+CRAWL_WORKERS = int(os.environ.get('GITHUB_CRAWL_WORKERS', 8))
+
+# the largest page size the api will hand out
+PER_PAGE = 100
+
+# how many items may wait between two stages of the crawl pipeline
+PIPELINE_QUEUE = int(os.environ.get('GITHUB_CRAWL_QUEUE', 100))
+
+# filters passed on to the issues endpoint, e.g. GITHUB_CRAWL_LABELS=JIRA to only
+# fetch what gets migrated, GITHUB_CRAWL_STATE=all and GITHUB_CRAWL_SINCE=2020-01-01T00:00:00Z
+CRAWL_LABELS = os.environ.get('GITHUB_CRAWL_LABELS') or None
+CRAWL_STATE = os.environ.get('GITHUB_CRAWL_STATE') or None
+CRAWL_SINCE = os.environ.get('GITHUB_CRAWL_SINCE') or None
+
+# the issues endpoint lists pull requests too, nothing downstream wants them
+CRAWL_PULLS = os.environ.get('GITHUB_CRAWL_PULLS', '0') == '1'
+
+# keep responses in data/github/http_cache.sqlite, see http_cache.py
+HTTP_CACHE = os.environ.get('GITHUB_HTTP_CACHE', '1') == '1'
+
+# override the workers and request_budget of repos.json
+REPO_WORKERS = int(os.environ.get('GITHUB_REPO_WORKERS', 0)) or None
+REQUEST_BUDGET = int(os.environ.get('GITHUB_REQUEST_BUDGET', 0)) or None
+
+
+class GithubConnectionThrottling(Exception):
+    pass
+
+
+class RequestBudgetExhausted(Exception):
+    pass
+
+
+class SyncState(object):
+
+    '''Persistent ETag/Last-Modified per url and updated_at watermark per repo'''
+
+    def __init__(self, fn=SYNC_STATE_FILE):
+        self.fn = fn
+        self.lock = threading.Lock()
+        self.urls = {}
+        self.watermarks = {}
+        if os.path.exists(self.fn):
+            with open(self.fn, 'r') as f:
+                data = json.loads(f.read())
+            self.urls = data.get('urls', {})
+            self.watermarks = data.get('watermarks', {})
+
+    def get_validators(self, url):
+        with self.lock:
+            return self.urls.get(url, {})
+
+    def set_validators(self, url, headers):
+        validators = {}
+        if headers.get('ETag'):
+            validators['etag'] = headers['ETag']
+        if headers.get('Last-Modified'):
+            validators['last_modified'] = headers['Last-Modified']
+        with self.lock:
+            if validators:
+                self.urls[url] = validators
+            else:
+                self.urls.pop(url, None)
+
+    def get_watermark(self, key):
+        with self.lock:
+            return self.watermarks.get(key)
+
+    def set_watermark(self, key, updated_at):
+        with self.lock:
+            if updated_at and updated_at > self.watermarks.get(key, ''):
+                self.watermarks[key] = updated_at
+
+    def save(self):
+        # repos are crawled in parallel, so the write happens under the lock too
+        with self.lock:
+            data = {'urls': self.urls, 'watermarks': self.watermarks}
+            tmpfn = self.fn + '.tmp'
+            with open(tmpfn, 'w') as f:
+                f.write(json.dumps(data))
+            os.replace(tmpfn, self.fn)
+
+
+class TokenScheduler(object):
+
+    '''Hand out the token with the most rate limit budget left
+
+    The remaining budget and reset time of each token are tracked from the
+    X-RateLimit-* headers of its responses, and a Retry-After from a
+    secondary rate limit blocks just that token. Callers only wait when
+    every token is exhausted or blocked.
+    '''
+
+    # what a token is assumed to have before its first response
+    DEFAULT_BUDGET = 5000
+
+    # never wait longer than this for a reset
+    MAX_WAIT = 60 * 65
+
+    def __init__(self, tokens):
+        if not tokens:
+            raise Exception('a github token is required, set GITHUB_TOKEN or GITHUB_TOKENS')
+        self.cond = threading.Condition()
+        self.tokens = {}
+        for token in tokens:
+            self.tokens[token] = {
+                'remaining': None,
+                'reset': 0,
+                'blocked_until': 0,
+                'inflight': 0
+            }
+
+    def _budget(self, meta, now):
+        if meta['blocked_until'] > now:
+            return 0
+        if meta['remaining'] is None or meta['reset'] <= now:
+            remaining = self.DEFAULT_BUDGET
+        else:
+            remaining = meta['remaining']
+        return remaining - meta['inflight']
+
+    def acquire(self):
+        with self.cond:
+            while True:
+                now = time.time()
+                budgets = [(self._budget(v, now), k) for k, v in self.tokens.items()]
+                budget, token = max(budgets, key=lambda x: x[0])
+                if budget > 0:
+                    self.tokens[token]['inflight'] += 1
+                    return token
+
+                # every token is spent, wait for the first one to come back
+                wakes = []
+                for meta in self.tokens.values():
+                    if meta['blocked_until'] > now:
+                        wakes.append(meta['blocked_until'])
+                    elif meta['remaining'] is not None and meta['remaining'] <= 0:
+                        wakes.append(meta['reset'])
+                rt = min(wakes) - now if wakes else 1
+                rt = min(max(rt, 1), self.MAX_WAIT)
+                logger.warning('all tokens are rate limited, sleeping {}s'.format(rt))
+                started = time.time()
+                self.cond.wait(timeout=rt)
+                metrics.inc('github_rate_limit_sleep_seconds_total', time.time() - started)
+
+    def release(self, token, rr=None):
+        with self.cond:
+            meta = self.tokens[token]
+            meta['inflight'] -= 1
+            if rr is not None:
+                if 'X-RateLimit-Remaining' in rr.headers:
+                    meta['remaining'] = int(rr.headers['X-RateLimit-Remaining'])
+                if 'X-RateLimit-Reset' in rr.headers:
+                    meta['reset'] = float(rr.headers['X-RateLimit-Reset']) + 1
+                if rr.status_code in (403, 429) and 'Retry-After' in rr.headers:
+                    meta['blocked_until'] = time.time() + float(rr.headers['Retry-After'])
+            self.cond.notify_all()
+
+    def block(self, token, seconds):
+        with self.cond:
+            meta = self.tokens[token]
+            meta['blocked_until'] = max(meta['blocked_until'], time.time() + seconds)
+            self.cond.notify_all()
+
+
+def is_rate_limited(rr):
+    if rr.status_code not in (403, 429):
+        return False
+    if 'Retry-After' in rr.headers:
+        return True
+    try:
+        message = rr.json().get('message', '')
+    except (ValueError, AttributeError):
+        message = rr.text
+    return 'rate limit' in message.lower()
+
+
+def send_on_token(scheduler, send, url):
+    '''Call send(token) on the token with the most budget until github does not rate limit it
+
+    Primary and secondary limits are recorded against the token by the scheduler,
+    so a limited request is just retried on the next best one.
+    '''
+    while True:
+        token = scheduler.acquire()
+        try:
+            rr = send(token)
+        except Exception:
+            scheduler.release(token)
+            raise
+        scheduler.release(token, rr)
+
+        if not is_rate_limited(rr):
+            return rr
+        logger.warning(f'rate limited on {url}')
+        metrics.inc('github_rate_limited_total', endpoint=metrics.endpoint(url))
+        if 'Retry-After' not in rr.headers and rr.headers.get('X-RateLimit-Remaining') != '0':
+            # secondary limits without a hint want at least a minute
+            scheduler.block(token, 60)
 
 
 class GHCrawler(object):
 
-    def __init__(self, tokens, dedupe=False):
-        self.tokens = tokens
+    def __init__(self, tokens, dedupe=False, workers=CRAWL_WORKERS, state=None, cache=None, request_budget=None):
+        self.tokens = [x for x in tokens if x]
+        # the most requests this crawler may send, shared by all repos
+        self.request_budget = request_budget
+        self.requests = 0
+        self.budget_lock = threading.Lock()
+        # only the crawler's own requests go through the cache
+        self.http = HTTPClient(cache=cache) if cache is not None else get_client()
+        self.scheduler = TokenScheduler(self.tokens)
+        self.workers = max(1, workers)
+        self.state = state
+        # pages are fetched on their own pool so that workers on the
+        # issue pool can wait on them without starving it
+        self.page_pool = ThreadPoolExecutor(max_workers=self.workers)
 
 
     @staticmethod
@@ -34,56 +259,82 @@ class GHCrawler(object):
             linkmap[rel] = parts[0]
         return linkmap
 
-    @timeout_decorator.timeout(5)
-    def call_requests(self, url, headers):
-        return requests.get(url, headers=headers)
+    @staticmethod
+    def set_params(url, **params):
+        '''Return the url with the given (non-empty) query params set'''
+        parts = urlsplit(url)
+        query = dict(parse_qsl(parts.query))
+        for k, v in params.items():
+            if v is not None:
+                query[k] = str(v)
+        return urlunsplit(parts._replace(query=urlencode(query)))
+
+    @staticmethod
+    def merge_pages(pages):
+        '''Join the pages of a listing in order, copying each item once'''
+        pages = [x for x in pages if x]
+        if len(pages) == 1:
+            return pages[0]
+        return list(itertools.chain.from_iterable(pages))
+
+    def spend(self):
+        with self.budget_lock:
+            if self.request_budget is not None and self.requests >= self.request_budget:
+                raise RequestBudgetExhausted(f'{self.requests} requests sent')
+            self.requests += 1
+
+    def call_requests(self, url, headers, revalidate=True):
+        # the shared client reuses connections and retries connection
+        # errors and timeouts with backoff on its own
+        return self.http.get(url, headers=headers, revalidate=revalidate)
 
     def _geturl(self, url, parent_url=None, since=None, conditional=True, follow=True):
 
-        if since:
-            _url = url + '?since=%s' % since
+        # ask for the largest pages on the first request, the next/last
+        # links returned by the api will carry the page size along
+        if follow and 'per_page=' not in url:
+            _url = GHCrawler.set_params(url, since=since, per_page=PER_PAGE)
         else:
-            _url = url
+            _url = GHCrawler.set_params(url, since=since)
 
-        token = random.choice(self.tokens)
         accepts = [
             'application/vnd.github.squirrel-girl-preview',
             'application/vnd.github.mockingbird-preview',
             'application/vnd.github.inertia-preview+json'
         ]
         headers = {
-            'Authorization': 'token {}'.format(token),
             'User-Agent': 'Awesome Octocat-App',
             'Accept': ','.join(accepts)
         }
-        logger.debug(headers)
+
+        # an unconditional fetch must not be answered from the http cache
+        # either, e.g. a 304 would hand back an old body and Link header
+        revalidate = conditional
+
+        # conditional requests turn unchanged data into a 304 which
+        # does not count against the rate limit ...
+        conditional = conditional and self.state is not None
+        if conditional:
+            validators = self.state.get_validators(_url)
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        def _send(token):
+            self.spend()
+            headers['Authorization'] = 'token {}'.format(token)
+            #rr = requests.get(_url, headers=headers)
+            return self.call_requests(_url, headers, revalidate=revalidate)
 
         rr = None
         success = False
-        errors = {
-            'connection': 0,
-            'timeout': 0
-        }
         while not success:
+            # every attempt goes out on whichever token has the most budget
             try:
-                #rr = requests.get(_url, headers=headers)
-                rr = self.call_requests(_url, headers)
-            except requests.exceptions.ConnectionError:
-                errors['connection'] += 1
-                if errors['connection'] >= 10:
-                    logging.error('too many connection errors for this request')
-                    raise GithubConnectionThrottling(_url)
-                logging.warning('sleeping {}s due to connection error'.format(60*2))
-                time.sleep(60*2)
-                continue
-            except timeout_decorator.timeout_decorator.TimeoutError:
-                errors['timeout'] += 1
-                if errors['timeout'] >= 10:
-                    logging.error('too many timeout errors for this request')
-                    raise GithubConnectionThrottling(_url)
-                logging.warning('sleeping {}s due to timeout'.format(60*2))
-                time.sleep(60*2)
-                continue
+                rr = send_on_token(self.scheduler, _send, _url)
+            except HTTPRetriesExhausted:
+                raise GithubConnectionThrottling(_url)
 
             # some things just can't be fetched for whatever reason
             #   /repos/ansible/ansible/pulls/27184/files
@@ -107,36 +358,20 @@ class GHCrawler(object):
                 success = False
                 break
 
-            jdata = {}
-            try:
-                jdata = rr.json()
-            except Exception as e:
-                logging.error(e)
-                import epdb; epdb.st()
-
-            if 'api rate limit exceeded' in jdata.get('message', '').lower():
-                if 'X-RateLimit-Reset' in rr.headers:
-                    rt = float(rr.headers['X-RateLimit-Reset']) - time.time()
-                    rt += 5
-
-                    # cap it at one hour
-                    if rt > (60 * 60):
-                        rt = (60 * 65)
-
-                    logging.warning('{}'.format(jdata.get('message')))
-                    logging.warning('sleeping {}s due to rate limiting'.format(rt))
-                    time.sleep(rt)
-                    continue
-
             #elif 'bad credentials' in jdata.get('message', '').lower():
             #    import epdb; epdb.st()
 
 
         logger.debug('{} {}'.format(_url, rr.status_code))
+        metrics.inc('github_requests_total', endpoint=metrics.endpoint(_url), status=rr.status_code)
+        if 'If-None-Match' in headers or 'If-Modified-Since' in headers:
+            metrics.inc('github_cache_total', kind='conditional', result='hit' if rr.status_code == 304 else 'miss')
 
         if rr.status_code == 304:
             data = None
         else:
+            if self.state is not None and rr.status_code == 200:
+                self.state.set_validators(_url, rr.headers)
             data = rr.json()
             # don't forget to set your tokens kids.
             if isinstance(data, dict):
@@ -144,74 +379,273 @@ class GHCrawler(object):
                     #import epdb; epdb.st()
                     pass
 
-        fetched = []
-        if 'Link' in rr.headers and follow:
+        if 'Link' in rr.headers and follow and rr.status_code != 304:
             links = GHCrawler.cleanlinks(rr.headers['Link'])
-            while 'next' in links:
-                logger.debug(links['next'])
-                if links['next'] == _url:
-                    break
-
-                if links['next'] in fetched:
-                    break
-
-                nrr, ndata = self._geturl(links['next'], parent_url=_url, conditional=conditional, follow=False)
-                fetched.append(links['next'])
-                if ndata:
-                    data += ndata
-                if 'Link' in nrr.headers:
-                    links = GHCrawler.cleanlinks(nrr.headers['Link'])
-                else:
-                    links = {}
+            data = GHCrawler.merge_pages([data] + list(self._iter_next_pages(links, _url)))
 
         #import epdb; epdb.st()
         return (rr, data)
 
+    def iter_pages(self, url, since=None, conditional=True):
+        '''Yield the data of each page of a listing as soon as it is its turn
+
+        Unlike _geturl, nothing is held beyond the pages in flight, so callers
+        can start working on the first page while later ones are still being
+        fetched. An unchanged (304) or empty listing yields nothing.
+        '''
+        if 'per_page=' not in url:
+            url = GHCrawler.set_params(url, per_page=PER_PAGE)
+        rr, data = self._geturl(url, since=since, conditional=conditional, follow=False)
+        if rr.status_code == 304 or not data:
+            return
+        yield data
+
+        if 'Link' in rr.headers:
+            links = GHCrawler.cleanlinks(rr.headers['Link'])
+            yield from self._iter_next_pages(links, GHCrawler.set_params(url, since=since))
+
+    def _iter_next_pages(self, links, parent_url):
+        if 'last' in links and 'next' in links:
+            yield from self._iter_pages_window(links['last'], parent_url)
+        elif 'next' in links:
+            yield from self._iter_follow_pages(links, parent_url)
+
+    def _iter_pages_window(self, last_url, parent_url):
+        '''Fetch pages 2..last with up to self.workers in flight and yield their data in order'''
+        query = dict(parse_qsl(urlsplit(last_url).query))
+        last = int(query.get('page', 1))
+        urls = iter([GHCrawler.set_params(last_url, page=x) for x in range(2, last + 1)])
+
+        def _submit(url):
+            return self.page_pool.submit(self._geturl, url, parent_url=parent_url, conditional=False, follow=False)
+
+        pending = collections.deque(_submit(x) for x in itertools.islice(urls, self.workers))
+        while pending:
+            data = pending.popleft().result()[1]
+            for url in itertools.islice(urls, 1):
+                pending.append(_submit(url))
+            yield data
+
+    def _iter_follow_pages(self, links, parent_url):
+        '''Walk the next links one by one when the api gives no last link'''
+        fetched = set([parent_url])
+        while 'next' in links:
+            logger.debug(links['next'])
+            if links['next'] in fetched:
+                break
+            fetched.add(links['next'])
 
-def main():
+            nrr, ndata = self._geturl(links['next'], parent_url=parent_url, conditional=False, follow=False)
+            yield ndata
+            if 'Link' in nrr.headers:
+                links = GHCrawler.cleanlinks(nrr.headers['Link'])
+            else:
+                links = {}
 
+
+def comments_todo(store, bd, issue):
+    '''Whether (and how) the comments of an issue need fetching, None if they are up to date
+
+    The saved issue doubles as the marker of the comments being in sync with it,
+    so it must only be written once its comments are (see write_issue).
     '''
-    data_dir = 'data/github'
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
+    repo = repo_from_url(issue['repository_url'])
+    cfn = os.path.join(bd, f"{issue['number']}_comments.json")
+
+    previous = None
+    if os.path.exists(cfn):
+        previous = store.get_issue(repo, issue['number'])
+
+    # the comments can only have changed if the issue did ...
+    if previous and previous['updated_at'] == issue['updated_at'] \
+            and previous['comments'] == issue['comments']:
+        metrics.inc('github_cache_total', kind='comments', result='hit')
+        return None
+    metrics.inc('github_cache_total', kind='comments', result='miss')
+
+    # a new comment may land on a later page than the first one, so the
+    # validators of the first page are only trusted if the count is the same
+    return {'conditional': previous is not None and previous['comments'] == issue['comments']}
+
+
+def write_issue(store, bd, issue):
+    fn = os.path.join(bd, f"{issue['number']}_issue.json")
+    with open(fn, 'w') as f:
+        f.write(json.dumps(issue))
+    store.put_issue(issue, path=fn)
+
+
+def fetch_comments(ghc, issue, conditional=False):
+    '''The comments of an issue, or None if they did not change'''
+    (crr, cdata) = ghc._geturl(issue['comments_url'], conditional=conditional)
+    if crr.status_code == 304:
+        return None
+    return cdata
+
+
+def write_comments(store, bd, issue, cdata):
+    repo = repo_from_url(issue['repository_url'])
+    cfn = os.path.join(bd, f"{issue['number']}_comments.json")
+    with open(cfn, 'w') as f:
+        f.write(json.dumps(cdata))
+    store.put_comments(repo, issue['number'], cdata, path=cfn)
+
+
+# tells a pipeline stage that no more items will come
+_DONE = object()
+
+
+def _run_stage(func, inq, outq, errors):
+    while True:
+        item = inq.get()
+        if item is _DONE:
+            break
+        try:
+            result = func(item)
+        except Exception as e:
+            # keep draining so the stages before this one never block
+            logger.exception(e)
+            errors.append(e)
+            continue
+        if result is not None and outq is not None:
+            outq.put(result)
+
+
+def crawl_repo(ghc, store, rp, bd, api_url, since=None):
+    '''Stream the issues of a repo through the check-issue, fetch-comments and write-comments stages
+
+    Pages are handed on as they arrive and the queues between the stages are
+    bounded, so memory stays flat however big the repo is and file writes
+    overlap with the requests. An issue is only saved after its comments, so
+    one whose comments could not be fetched is fetched again on the next run.
+    Returns the newest updated_at seen, or None if nothing changed.
     '''
+    issues_q = queue.Queue(maxsize=PIPELINE_QUEUE)
+    fetch_q = queue.Queue(maxsize=PIPELINE_QUEUE)
+    comments_q = queue.Queue(maxsize=PIPELINE_QUEUE)
+    errors = []
+
+    def _check_issue(issue):
+        logger.info(f"{rp} / {issue['number']}")
+        todo = comments_todo(store, bd, issue)
+        if todo is None:
+            write_issue(store, bd, issue)
+            return None
+        return (issue, todo)
+
+    def _fetch_comments(item):
+        issue, todo = item
+        # None if the comments did not change
+        return (issue, fetch_comments(ghc, issue, **todo))
+
+    def _write_comments(item):
+        issue, cdata = item
+        if cdata is not None:
+            write_comments(store, bd, issue, cdata)
+        write_issue(store, bd, issue)
+
+    def _start(func, inq, outq, count=1):
+        threads = [threading.Thread(target=_run_stage, args=(func, inq, outq, errors)) for x in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    writers = _start(_check_issue, issues_q, fetch_q)
+    fetchers = _start(_fetch_comments, fetch_q, comments_q, count=ghc.workers)
+    comment_writers = _start(_write_comments, comments_q, None)
+
+    newest = None
+    try:
+        for page in ghc.iter_pages(api_url, since=since):
+            for issue in page:
+                if newest is None or issue['updated_at'] > newest:
+                    newest = issue['updated_at']
+                if 'pull_request' in issue and not CRAWL_PULLS:
+                    metrics.inc('github_pulls_skipped_total')
+                    continue
+                issues_q.put(issue)
+    finally:
+        # shut the stages down front to back
+        for threads, inq in ((writers, issues_q), (fetchers, fetch_q), (comment_writers, comments_q)):
+            for thread in threads:
+                inq.put(_DONE)
+            for thread in threads:
+                thread.join()
 
-    # add more repos to this list ...
-    repos = [
-        ['RedHatInsights', 'tower-analytics-backend'],
-        ['RedHatInsights', 'tower-analytics-frontend']
-    ] 
+    if errors:
+        raise errors[0]
+    return newest
 
-    # the crawler is a custom api crawler with builtin rate limiting and pagination...
-    ghc = GHCrawler(tokens=[os.environ.get('GITHUB_TOKEN')])
 
-    # iterate each repo ...
-    for rp in repos:
-        org = rp[0]
-        repo = rp[1]
+def crawl_one(ghc, store, rp):
+    org = rp[0]
+    repo = rp[1]
 
-        # keep data for each repo in a separate folder
-        bd = os.path.join(DATA_DIR, org, repo)
-        if not os.path.exists(bd):
-            os.makedirs(bd)
+    # keep data for each repo in a separate folder
+    bd = os.path.join(DATA_DIR, org, repo)
+    if not os.path.exists(bd):
+        os.makedirs(bd)
 
-        # construct the api url and crawl it ...
-        api_url = os.path.join('https://api.github.com/repos', org, repo, 'issues')
-        (irr, idata) = ghc._geturl(api_url)
+    # construct the api url and crawl it, letting the api do the filtering ...
+    api_url = os.path.join('https://api.github.com/repos', org, repo, 'issues')
+    api_url = GHCrawler.set_params(api_url, labels=CRAWL_LABELS, state=CRAWL_STATE)
 
-        # dump each issue and comments to json files ...
-        for issue in idata:
+    # only ask for issues updated since the last run with the same filters ...
+    wkey = f'{org}/{repo}'
+    if CRAWL_LABELS or CRAWL_STATE:
+        wkey += f'?labels={CRAWL_LABELS or ""}&state={CRAWL_STATE or ""}'
+    since = max(x for x in [ghc.state.get_watermark(wkey), CRAWL_SINCE, ''] if x is not None) or None
 
-            logger.info(f"{rp} / {issue['number']}")
+    # dump each issue and comments to json files while the next
+    # pages and the comments of other issues are being fetched ...
+    newest = crawl_repo(ghc, store, rp, bd, api_url, since=since)
+    if newest is None:
+        logger.info(f'{rp} has no updated issues')
 
-            fn = os.path.join(bd, f"{issue['number']}_issue.json")
-            with open(fn, 'w') as f:
-                f.write(json.dumps(issue))
+    ghc.state.set_watermark(wkey, newest)
+    ghc.state.save()
 
-            (crr, cdata) = ghc._geturl(issue['comments_url'])
-            cfn = os.path.join(bd, f"{issue['number']}_comments.json")
-            with open(cfn, 'w') as f:
-                f.write(json.dumps(cdata))
+
+def main():
+
+    # the repos and orgs to crawl are listed in repos.json ...
+    config = RepoConfig.load()
+
+    # the crawler is a custom api crawler with builtin rate limiting and pagination...
+    state = SyncState()
+    # pick up anything written before the store existed ...
+    store = IssueStore()
+    store.import_tree(DATA_DIR)
+    tokens = os.environ.get('GITHUB_TOKENS', os.environ.get('GITHUB_TOKEN', '')).split(',')
+    cache = HTTPCache() if HTTP_CACHE else None
+    ghc = GHCrawler(
+        tokens=tokens,
+        state=state,
+        cache=cache,
+        request_budget=REQUEST_BUDGET or config.request_budget
+    )
+    repos = config.resolve(ghc)
+
+    # crawl several repos at once, they all share the tokens, the
+    # connection pool and the request budget of the one crawler ...
+    errors = []
+    with ThreadPoolExecutor(max_workers=REPO_WORKERS or config.workers) as executor:
+        futures = [(rp, executor.submit(crawl_one, ghc, store, rp)) for rp in repos]
+        for rp, future in futures:
+            try:
+                future.result()
+            except RequestBudgetExhausted:
+                logger.warning(f'{rp} stopped early, the request budget is used up')
+            except Exception as e:
+                logger.exception(e)
+                errors.append(e)
+
+    logger.info(f'{ghc.requests} requests sent')
+    if cache is not None:
+        cache.close()
+    metrics.export('github_crawl')
+    if errors:
+        raise errors[0]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+
+"""
+http_cache.py - an explicit, size bounded sqlite cache for the github crawl
+
+Only successful GET responses are stored. Each endpoint has a time to live: within it
+the stored response is served without a request, after it the response is revalidated
+with its ETag/Last-Modified and a 304 serves the stored body (which github does not
+count against the rate limit). Endpoints whose data the crawl relies on being current
+(issues and comments) default to a ttl of 0, i.e. always revalidate. Least recently
+used entries are evicted once the cache outgrows its size limit.
+
+The cache is handed to an HTTPClient explicitly, nothing is patched process wide.
+
+    python http_cache.py stats
+    python http_cache.py compact
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from logzero import logger
+
+import metrics
+
+
+CACHE_FILE = os.environ.get('HTTP_CACHE_FILE', os.path.join('data', 'github', 'http_cache.sqlite'))
+CACHE_MAX_BYTES = int(float(os.environ.get('HTTP_CACHE_MAX_MB', 512)) * 1024 * 1024)
+
+# (path regex, seconds), the first match wins
+CACHE_TTLS = [
+    (re.compile(r'^/users/[^/]+$'), 24 * 3600),
+    (re.compile(r'^/orgs/[^/]+/repos$'), 3600),
+    (re.compile(r'^/repos/[^/]+/[^/]+$'), 3600),
+    (re.compile(r'^/repos/[^/]+/[^/]+/labels$'), 3600),
+    (re.compile(r'/issues(/\d+(/comments)?)?$'), 0),
+]
+DEFAULT_TTL = 0
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+'''
+
+# response headers worth keeping, the rest describe the original transfer
+KEEP_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Link')
+
+
+def ttl_for(url):
+    path = requests.utils.urlparse(url).path
+    for pattern, ttl in CACHE_TTLS:
+        if pattern.search(path):
+            return ttl
+    return DEFAULT_TTL
+
+
+class HTTPCache(object):
+
+    CONDITIONAL_HEADERS = ('If-None-Match', 'If-Modified-Since')
+
+    def __init__(self, fn=CACHE_FILE, max_bytes=CACHE_MAX_BYTES):
+        self.fn = fn
+        self.max_bytes = max_bytes
+        dn = os.path.dirname(fn)
+        if dn and not os.path.exists(dn):
+            os.makedirs(dn)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(fn, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.executescript(SCHEMA)
+            self.total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        self.counts = {}
+
+    def close(self):
+        with self.lock, self.conn:
+            self._flush_counts()
+        self.conn.close()
+
+    @staticmethod
+    def key(url, headers):
+        # the preview media types change the payload, the token does not
+        return (headers or {}).get('Accept', '') + ' ' + url
+
+    def count(self, result):
+        metrics.inc('http_cache_total', result=result)
+        with self.lock:
+            self.counts[result] = self.counts.get(result, 0) + 1
+
+    def _flush_counts(self):
+        for name, value in self.counts.items():
+            self.conn.execute(
+                'INSERT INTO counters (name, value) VALUES (?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+                (name, value)
+            )
+        self.counts = {}
+
+    def lookup(self, url, headers):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT * FROM entries WHERE key=?', (self.key(url, headers),)
+            ).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def is_fresh(entry):
+        return entry['expires_at'] > time.time()
+
+    @staticmethod
+    def validators(entry):
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    @staticmethod
+    def response(entry, url):
+        '''Rebuild a requests response from a stored entry'''
+        rr = requests.Response()
+        rr.status_code = entry['status']
+        rr.reason = 'OK'
+        rr.url = url
+        rr.headers = CaseInsensitiveDict(json.loads(entry['headers']))
+        rr._content = entry['body']
+        rr.encoding = 'utf-8'
+        rr.from_cache = True
+        return rr
+
+    def touch(self, entry, rr=None):
+        '''Mark an entry as used, and as revalidated if a 304 came back'''
+        now = time.time()
+        with self.lock, self.conn:
+            if rr is None:
+                self.conn.execute('UPDATE entries SET last_used=? WHERE key=?', (now, entry['key']))
+            else:
+                self.conn.execute(
+                    'UPDATE entries SET last_used=?, stored_at=?, expires_at=?, '
+                    'etag=COALESCE(?, etag), last_modified=COALESCE(?, last_modified) WHERE key=?',
+                    (
+                        now,
+                        now,
+                        now + ttl_for(entry['url']),
+                        rr.headers.get('ETag'),
+                        rr.headers.get('Last-Modified'),
+                        entry['key']
+                    )
+                )
+
+    def store(self, url, headers, rr):
+        '''Keep a successful response, anything else is never cached'''
+        if rr.status_code < 200 or rr.status_code >= 300:
+            return
+        ttl = ttl_for(url)
+        etag = rr.headers.get('ETag')
+        last_modified = rr.headers.get('Last-Modified')
+        if not ttl and not etag and not last_modified:
+            # could neither be served nor revalidated
+            return
+
+        now = time.time()
+        body = rr.content
+        kept = dict((k, rr.headers[k]) for k in KEEP_HEADERS if k in rr.headers)
+        key = self.key(url, headers)
+        with self.lock, self.conn:
+            old = self.conn.execute('SELECT size FROM entries WHERE key=?', (key,)).fetchone()
+            self.conn.execute(
+                'INSERT OR REPLACE INTO entries '
+                '(key, url, status, headers, body, etag, last_modified, stored_at, expires_at, last_used, size) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, url, rr.status_code, json.dumps(kept), body, etag, last_modified, now, now + ttl, now, len(body))
+            )
+            self.total += len(body) - (old['size'] if old else 0)
+            if self.total > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+
+    def _evict(self, target):
+        '''Drop least recently used entries until the cache is below target bytes'''
+        evicted = 0
+        rows = self.conn.execute('SELECT key, size FROM entries ORDER BY last_used').fetchall()
+        for row in rows:
+            if self.total <= target:
+                break
+            self.conn.execute('DELETE FROM entries WHERE key=?', (row['key'],))
+            self.total -= row['size']
+            evicted += 1
+        metrics.inc('http_cache_evictions_total', evicted)
+        logger.debug(f'evicted {evicted} entries from {self.fn}')
+
+    def stats(self):
+        with self.lock, self.conn:
+            self._flush_counts()
+            row = self.conn.execute(
+                'SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS bytes, '
+                'COALESCE(SUM(expires_at > ?), 0) AS fresh FROM entries',
+                (time.time(),)
+            ).fetchone()
+            counters = dict((x['name'], x['value']) for x in self.conn.execute('SELECT * FROM counters'))
+        stats = dict(row)
+        stats['max_bytes'] = self.max_bytes
+        stats['counters'] = counters
+        lookups = sum(v for k, v in counters.items() if k != 'bypass')
+        stats['hit_ratio'] = round((counters.get('hit', 0) + counters.get('revalidated', 0)) / lookups, 3) if lookups else None
+        return stats
+
+    def compact(self):
+        '''Drop entries that can neither be served nor revalidated, enforce the size limit and shrink the file'''
+        with self.lock, self.conn:
+            dropped = self.conn.execute(
+                'DELETE FROM entries WHERE expires_at <= ? AND etag IS NULL AND last_modified IS NULL',
+                (time.time(),)
+            ).rowcount
+            self.total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            if self.total > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+        with self.lock:
+            self.conn.execute('VACUUM')
+        logger.info(f'dropped {dropped} dead entries from {self.fn}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='inspect or compact the http cache of the github crawl')
+    parser.add_argument('command', choices=['stats', 'compact'])
+    parser.add_argument('--file', default=CACHE_FILE)
+    args = parser.parse_args()
+
+    cache = HTTPCache(args.file)
+    if args.command == 'compact':
+        cache.compact()
+    print(json.dumps(cache.stats(), indent=2))
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
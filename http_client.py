@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+"""
+http_client.py - a pooled, keep-alive http client shared by the github and jira scripts
+
+Every script talks http through an HTTPClient so that connections are reused across
+requests (and threads), timeouts are native connect/read timeouts instead of SIGALRM
+and transient failures are retried with exponential backoff plus jitter.
+"""
+
+import random
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from logzero import logger
+
+import metrics
+
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+POOL_SIZE = 32
+MAX_RETRIES = 10
+BACKOFF_BASE = 1
+BACKOFF_CAP = 120
+
+# only retried for idempotent methods, the others are only retried when they
+# never reached the server (see connect_failed)
+RETRY_STATUSES = (500, 502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+
+class HTTPRetriesExhausted(Exception):
+    pass
+
+
+def connect_failed(e):
+    '''Whether a connection error or timeout happened before the request was sent'''
+    if isinstance(e, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(e, requests.exceptions.ReadTimeout):
+        return False
+    reason = e.args[0] if e.args else None
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, NewConnectionError)
+
+
+def backoff(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    '''Full jitter exponential backoff for the given (1 based) attempt'''
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class HTTPClient(object):
+
+    def __init__(self, pool_size=POOL_SIZE, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), retries=MAX_RETRIES, cache=None):
+        self.timeout = timeout
+        self.retries = retries
+        # an http_cache.HTTPCache for the GETs of this client only
+        self.cache = cache
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, revalidate=True, **kwargs):
+        '''Send a request, GETs go through the cache if there is one
+
+        With revalidate=False a stale cache entry is not revalidated, the url is
+        fetched in full for callers that must not be handed an old body.
+        '''
+        method = method.upper()
+        if self.cache is None or method != 'GET':
+            return self._request(method, url, **kwargs)
+
+        headers = kwargs.get('headers') or {}
+        if any(x in headers for x in self.cache.CONDITIONAL_HEADERS):
+            # the caller revalidates on its own and wants to see the 304
+            rr = self._request(method, url, **kwargs)
+            self.cache.count('bypass')
+            self.cache.store(url, headers, rr)
+            return rr
+
+        entry = self.cache.lookup(url, headers)
+        if entry and self.cache.is_fresh(entry):
+            self.cache.touch(entry)
+            self.cache.count('hit')
+            return self.cache.response(entry, url)
+
+        if entry and revalidate:
+            kwargs['headers'] = dict(headers, **self.cache.validators(entry))
+        rr = self._request(method, url, **kwargs)
+
+        if entry and revalidate and rr.status_code == 304:
+            self.cache.touch(entry, rr)
+            self.cache.count('revalidated')
+            return self.cache.response(entry, url)
+
+        self.cache.count('miss')
+        self.cache.store(url, headers, rr)
+        return rr
+
+    def _request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+
+        attempt = 0
+        while True:
+            started = time.time()
+            try:
+                rr = self.session.request(method, url, **kwargs)
+                metrics.observe(
+                    'http_request_seconds',
+                    time.time() - started,
+                    host=urlsplit(url).netloc,
+                    method=method,
+                    endpoint=metrics.endpoint(url),
+                    status=rr.status_code
+                )
+                if rr.status_code not in RETRY_STATUSES or method not in IDEMPOTENT_METHODS:
+                    return rr
+                error = f'status {rr.status_code}'
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if method not in IDEMPOTENT_METHODS and not connect_failed(e):
+                    # the server may have acted on it, sending it again could
+                    # e.g. create a second ticket or comment
+                    logger.error(f'{e.__class__.__name__} for {method} {url}, not retrying')
+                    raise
+                rr = None
+                error = e.__class__.__name__
+
+            attempt += 1
+            if attempt >= self.retries:
+                logger.error(f'too many errors for {url}')
+                if rr is not None:
+                    return rr
+                raise HTTPRetriesExhausted(url)
+
+            rt = backoff(attempt)
+            logger.warning(f'{error} for {url}, retrying in {rt:.1f}s')
+            metrics.inc('http_retries_total', host=urlsplit(url).netloc)
+            metrics.inc('http_retry_sleep_seconds_total', rt, host=urlsplit(url).netloc)
+            time.sleep(rt)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    '''The process wide client, created on first use'''
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient()
+        return _client
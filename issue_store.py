@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+
+"""
+issue_store.py - an indexed sqlite store of the crawled github issues and comments
+
+github_tickets.py writes every issue and comment list both as json files under
+data/github/<org>/<repo>/ and into this store. Readers ask the store instead of
+globbing and parsing every file, and import_tree keeps it in sync with whatever
+is on disk (only files whose size or mtime changed get parsed again).
+"""
+
+import glob
+import json
+import os
+import sqlite3
+import threading
+
+from logzero import logger
+
+
+DATA_DIR = 'data/github'
+STORE_FILE = os.path.join(DATA_DIR, 'issues.sqlite')
+
+# the label that marks an issue for migration, github label names are case insensitive
+MIGRATE_LABEL = 'JIRA'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS issues (
+    repo TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    state TEXT,
+    author TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    repository_url TEXT,
+    html_url TEXT,
+    path TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (repo, number)
+);
+CREATE INDEX IF NOT EXISTS issues_author ON issues (author);
+CREATE INDEX IF NOT EXISTS issues_state ON issues (state);
+CREATE INDEX IF NOT EXISTS issues_updated_at ON issues (updated_at);
+
+CREATE TABLE IF NOT EXISTS labels (
+    repo TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (repo, number, name)
+);
+CREATE INDEX IF NOT EXISTS labels_name ON labels (name);
+CREATE INDEX IF NOT EXISTS labels_name_nocase ON labels (name COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS comments (
+    repo TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (repo, number)
+);
+
+CREATE TABLE IF NOT EXISTS comment_authors (
+    repo TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    author TEXT NOT NULL,
+    PRIMARY KEY (repo, number, author)
+);
+
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER
+);
+'''
+
+
+def repo_from_url(repository_url):
+    '''https://api.github.com/repos/<org>/<repo> -> <org>/<repo>'''
+    return '/'.join(repository_url.rstrip('/').split('/')[-2:])
+
+
+def label_names(issue):
+    '''The lowercased label names of an issue'''
+    return set(x['name'].lower() for x in issue.get('labels', []))
+
+
+def has_label(issue, label):
+    return label.lower() in label_names(issue)
+
+
+class IssueStore(object):
+
+    def __init__(self, fn=STORE_FILE):
+        self.fn = fn
+        dn = os.path.dirname(fn)
+        if dn and not os.path.exists(dn):
+            os.makedirs(dn)
+        # the crawler writes from its worker threads
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(fn, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.executescript(SCHEMA)
+            self._backfill_comment_authors()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _record_file(self, path):
+        if not path:
+            return
+        st = os.stat(path)
+        self.conn.execute(
+            'INSERT OR REPLACE INTO files (path, mtime, size) VALUES (?, ?, ?)',
+            (path, st.st_mtime, st.st_size)
+        )
+
+    def put_issue(self, issue, path=None):
+        repo = repo_from_url(issue['repository_url'])
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO issues '
+                '(repo, number, state, author, created_at, updated_at, repository_url, html_url, path, data) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    repo,
+                    issue['number'],
+                    issue.get('state'),
+                    (issue.get('user') or {}).get('login'),
+                    issue.get('created_at'),
+                    issue.get('updated_at'),
+                    issue['repository_url'],
+                    issue.get('html_url'),
+                    path,
+                    json.dumps(issue)
+                )
+            )
+            self.conn.execute('DELETE FROM labels WHERE repo=? AND number=?', (repo, issue['number']))
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO labels (repo, number, name) VALUES (?, ?, ?)',
+                [(repo, issue['number'], x['name']) for x in issue.get('labels', [])]
+            )
+            self._record_file(path)
+
+    def _put_comment_authors(self, repo, number, comments):
+        self.conn.execute('DELETE FROM comment_authors WHERE repo=? AND number=?', (repo, number))
+        if not isinstance(comments, list):
+            return
+        self.conn.executemany(
+            'INSERT OR IGNORE INTO comment_authors (repo, number, author) VALUES (?, ?, ?)',
+            [(repo, number, x['user']['login']) for x in comments if x.get('user')]
+        )
+
+    def _backfill_comment_authors(self):
+        '''Fill comment_authors for stores created before it existed'''
+        if self.conn.execute('SELECT 1 FROM comment_authors LIMIT 1').fetchone():
+            return
+        for row in self.conn.execute('SELECT repo, number, data FROM comments').fetchall():
+            self._put_comment_authors(row['repo'], row['number'], json.loads(row['data']))
+
+    def put_comments(self, repo, number, comments, path=None):
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO comments (repo, number, data) VALUES (?, ?, ?)',
+                (repo, number, json.dumps(comments))
+            )
+            self._put_comment_authors(repo, number, comments)
+            self._record_file(path)
+
+    def get_issue(self, repo, number):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT data FROM issues WHERE repo=? AND number=?', (repo, number)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row['data'])
+
+    def get_comments(self, repo, number):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT data FROM comments WHERE repo=? AND number=?', (repo, number)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row['data'])
+
+    def issues_with_label(self, label):
+        '''The (created_at, repository_url, number, path) of every issue with the label (in any case), oldest first'''
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT i.created_at, i.repository_url, i.number, i.path FROM issues i '
+                'JOIN labels l ON l.repo = i.repo AND l.number = i.number '
+                'WHERE l.name = ? COLLATE NOCASE GROUP BY i.repo, i.number ORDER BY i.created_at',
+                (label,)
+            ).fetchall()
+        return [list(x) for x in rows]
+
+    def authors(self, comments=False):
+        '''The logins of everyone who opened an issue, and with comments=True commented on one'''
+        query = 'SELECT DISTINCT author FROM issues WHERE author IS NOT NULL'
+        if comments:
+            query += ' UNION SELECT DISTINCT author FROM comment_authors'
+        with self.lock:
+            rows = self.conn.execute(query).fetchall()
+        return set(x['author'] for x in rows)
+
+    def import_tree(self, data_dir=DATA_DIR):
+        '''Load any new or changed <number>_issue.json / <number>_comments.json files'''
+        with self.lock:
+            known = dict(
+                (x['path'], (x['mtime'], x['size']))
+                for x in self.conn.execute('SELECT path, mtime, size FROM files')
+            )
+
+        imported = 0
+        for fn in sorted(glob.glob(os.path.join(data_dir, '*', '*', '*.json'))):
+            if not fn.endswith('_issue.json') and not fn.endswith('_comments.json'):
+                continue
+            st = os.stat(fn)
+            if known.get(fn) == (st.st_mtime, st.st_size):
+                continue
+
+            with open(fn, 'r') as f:
+                data = json.loads(f.read())
+            if fn.endswith('_issue.json'):
+                self.put_issue(data, path=fn)
+            else:
+                parts = fn.split(os.sep)
+                repo = '/'.join(parts[-3:-1])
+                number = int(parts[-1].split('_')[0])
+                self.put_comments(repo, number, data, path=fn)
+            imported += 1
+
+        if imported:
+            logger.info(f'imported {imported} changed files into {self.fn}')
+        return imported
+
+
+def main():
+    store = IssueStore()
+    store.import_tree()
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
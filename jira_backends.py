@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""
+jira_backends.py - the ways JiraWrapper can write tickets and comments to jira
+
+The selenium backend clicks through the create modal and the comment form, which
+works for any account but takes tens of seconds per ticket. The rest backend posts
+the same data to /rest/api/2 using the cookies of the sso session selenium logged in.
+"""
+
+import time
+
+from logzero import logger
+
+import metrics
+
+
+PROJECT_KEY = 'AA'
+SECURITY_LEVEL = 'Red Hat Internal'
+# the comment visibility of private repos
+COMMENT_SECURITY_LEVEL = 'Red Hat Employee'
+PRIVATE_COMMENT_VISIBILITY = {'type': 'group', 'value': COMMENT_SECURITY_LEVEL}
+
+
+class JiraBackend(object):
+
+    name = None
+
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+
+    def create_issue(self, issue_data, private=False, itype='Bug'):
+        """Create the ticket for a github issue and return its index entry"""
+        raise NotImplementedError
+
+    def create_comments(self, ticket, cdata, private=False):
+        """Add any github comments the ticket does not have yet"""
+        raise NotImplementedError
+
+
+class SeleniumBackend(JiraBackend):
+
+    name = 'selenium'
+
+    def create_issue(self, issue_data, private=False, itype='Bug'):
+        started = time.time()
+        self.wrapper.create_issue(issue_data, private=private, itype=itype)
+        return self.wrapper.find_created_issue(issue_data['html_url'], started)
+
+    def create_comments(self, ticket, cdata, private=False):
+        self.wrapper.create_comments(ticket, cdata, private=private)
+
+
+class RestBackend(JiraBackend):
+
+    name = 'rest'
+
+    def create_issue(self, issue_data, private=False, itype='Bug'):
+        rest = self.wrapper.rest
+        summary = self.wrapper.summary_for(issue_data)
+        description = self.wrapper.description_for(issue_data)
+
+        fields = {
+            'project': {'key': PROJECT_KEY},
+            'issuetype': {'name': itype},
+            'summary': summary,
+            'description': description
+        }
+
+        component = self.wrapper.component_for(issue_data)
+        if component:
+            fields['components'] = [{'name': component}]
+
+        if private:
+            fields['security'] = {'name': SECURITY_LEVEL}
+
+        if itype == 'Epic':
+            fields[rest.get_field_id('Epic Name')] = summary
+
+        reporter = self.wrapper.reporter_for(issue_data)
+        if reporter:
+            fields['reporter'] = {'name': reporter['name']}
+
+        logger.info(f"create ticket for {issue_data['html_url']}")
+        with metrics.timer('jira_step_seconds', step='submit'):
+            jdata = rest.post_json('/rest/api/2/issue', {'fields': fields})
+
+        idata = {
+            'github_link': issue_data['html_url'],
+            'number': jdata['key'],
+            'api_url': jdata['self'],
+            'url': f'https://issues.redhat.com/projects/{PROJECT_KEY}/issues/' + jdata['key'],
+            'description': description
+        }
+        return self.wrapper.add_jira_record(idata)
+
+    def create_comments(self, ticket, cdata, private=False):
+        comment_index = self.wrapper.comment_index
+        for cd in cdata:
+            if comment_index.has(ticket['number'], cd['html_url']):
+                continue
+
+            logger.info('adding comment ' + cd['html_url'])
+            started = time.time()
+            payload = {'body': self.wrapper.comment_body(cd)}
+            if private:
+                payload['visibility'] = PRIVATE_COMMENT_VISIBILITY
+            self.wrapper.rest.post_json(f"/rest/api/2/issue/{ticket['number']}/comment", payload)
+            self.wrapper.record_comment(ticket, cd)
+            metrics.observe('jira_step_seconds', time.time() - started, step='comment')
+
+
+BACKENDS = dict((x.name, x) for x in [SeleniumBackend, RestBackend])
+
+
+def get_backend(name, wrapper):
+    if name not in BACKENDS:
+        raise Exception(f'unknown jira backend {name}, choose one of {sorted(BACKENDS)}')
+    return BACKENDS[name](wrapper)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""
+jira_index.py - map github issue urls to the jira tickets they were migrated to
+
+A migrated ticket has the github html_url as the first line of its description.
+The index is built once from the scraped tickets, updated in place whenever a
+ticket is created and saved next to AA_jira_tickets.json so other scripts can
+load it without the descriptions.
+
+The comment index does the same for comments: per ticket, the set of github
+comment urls that already appear in its jira comments.
+"""
+
+import json
+import os
+import re
+import threading
+
+
+JIRA_DIR = 'data/jira'
+INDEX_FILE = os.path.join(JIRA_DIR, 'AA_jira_index.json')
+COMMENT_INDEX_FILE = os.path.join(JIRA_DIR, 'AA_comment_index.json')
+
+GITHUB_URL_RE = re.compile(r'https://github\.com/\S+')
+GITHUB_COMMENT_URL_RE = re.compile(r'https://github\.com/[^\s#]+#issuecomment-\d+')
+
+
+def normalize_url(url):
+    return url.strip().rstrip('/')
+
+
+def github_link(description):
+    '''The github url on the first line of a ticket description, if any'''
+    first = (description or '').split('\n')[0]
+    match = GITHUB_URL_RE.search(first)
+    if not match:
+        return None
+    return normalize_url(match.group(0))
+
+
+class JiraIndex(object):
+
+    def __init__(self, records=None):
+        self.lock = threading.Lock()
+        self.by_github = {}
+        for record in records or []:
+            self.add(record)
+
+    def add(self, record):
+        '''Index a scraped ticket, the first ticket seen for a github url wins'''
+        if not record.get('github_link'):
+            return
+        entry = {
+            'github_link': record['github_link'],
+            'number': record['number'],
+            'url': record['url'],
+            'api_url': record['api_url']
+        }
+        with self.lock:
+            self.by_github.setdefault(normalize_url(record['github_link']), entry)
+
+    def get(self, github_url):
+        with self.lock:
+            return self.by_github.get(normalize_url(github_url))
+
+    def __contains__(self, github_url):
+        return self.get(github_url) is not None
+
+    def __len__(self):
+        return len(self.by_github)
+
+    def records(self):
+        with self.lock:
+            return list(self.by_github.values())
+
+    def save(self, fn=INDEX_FILE):
+        dn = os.path.dirname(fn)
+        if dn and not os.path.exists(dn):
+            os.makedirs(dn)
+        with self.lock:
+            data = json.dumps(self.by_github, indent=2, sort_keys=True)
+        tmpfn = fn + '.tmp'
+        with open(tmpfn, 'w') as f:
+            f.write(data)
+        os.replace(tmpfn, fn)
+
+    @classmethod
+    def load(cls, fn=INDEX_FILE):
+        index = cls()
+        if os.path.exists(fn):
+            with open(fn, 'r') as f:
+                index.by_github = json.loads(f.read())
+        return index
+
+
+class CommentIndex(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_ticket = {}
+
+    def add_bodies(self, key, bodies):
+        urls = set()
+        for body in bodies:
+            urls.update(GITHUB_COMMENT_URL_RE.findall(body or ''))
+        with self.lock:
+            self.by_ticket.setdefault(key, set()).update(urls)
+
+    def add(self, key, comment_url):
+        with self.lock:
+            self.by_ticket.setdefault(key, set()).add(comment_url)
+
+    def has(self, key, comment_url):
+        with self.lock:
+            return comment_url in self.by_ticket.get(key, ())
+
+    def save(self, fn=COMMENT_INDEX_FILE):
+        dn = os.path.dirname(fn)
+        if dn and not os.path.exists(dn):
+            os.makedirs(dn)
+        with self.lock:
+            data = json.dumps(dict((k, sorted(v)) for k, v in self.by_ticket.items()), indent=2, sort_keys=True)
+        tmpfn = fn + '.tmp'
+        with open(tmpfn, 'w') as f:
+            f.write(data)
+        os.replace(tmpfn, fn)
+
+    @classmethod
+    def load(cls, fn=COMMENT_INDEX_FILE):
+        index = cls()
+        if os.path.exists(fn):
+            with open(fn, 'r') as f:
+                index.by_ticket = dict((k, set(v)) for k, v in json.loads(f.read()).items())
+        return index
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+"""
+jira_rest.py - use the jira rest api with the session of the logged in browser
+
+Regular users can not create api tokens on issues.redhat.com, but once selenium has
+gone through the sso login the session cookies are just as good for the rest api.
+"""
+
+import collections
+
+from concurrent.futures import ThreadPoolExecutor
+
+from http_client import HTTPClient
+
+
+SEARCH_PAGE_SIZE = 100
+
+
+class JiraREST(object):
+
+    def __init__(self, url, client=None):
+        self.url = url.rstrip('/')
+        # jira gets its own client so the sso cookies never leak to github
+        self.client = client or HTTPClient()
+        self.field_ids = None
+        self.users = {}
+
+    def load_cookies(self, cookies):
+        '''Copy the cookies of a selenium driver into the http session'''
+        for cookie in cookies:
+            self.client.session.cookies.set(
+                cookie['name'],
+                cookie['value'],
+                domain=cookie.get('domain'),
+                path=cookie.get('path', '/')
+            )
+
+    def get_json(self, url, params=None):
+        if not url.startswith('http'):
+            url = self.url + url
+        rr = self.client.get(url, params=params, headers={'Accept': 'application/json'})
+        rr.raise_for_status()
+        return rr.json()
+
+    def post_json(self, url, payload):
+        if not url.startswith('http'):
+            url = self.url + url
+        headers = {
+            'Accept': 'application/json',
+            # cookie authenticated writes are otherwise rejected by the xsrf check
+            'X-Atlassian-Token': 'no-check'
+        }
+        rr = self.client.post(url, json=payload, headers=headers)
+        rr.raise_for_status()
+        return rr.json()
+
+    def iter_comments(self, key, start=0, page_size=SEARCH_PAGE_SIZE):
+        """Yield the comments of a ticket from start on, page by page"""
+        while True:
+            jdata = self.get_json(
+                f'/rest/api/2/issue/{key}/comment',
+                params={'startAt': start, 'maxResults': page_size}
+            )
+            yield from jdata['comments']
+            start += len(jdata['comments'])
+            if not jdata['comments'] or start >= jdata['total']:
+                break
+
+    def get_field_id(self, name):
+        """The id of a (custom) field by its display name, e.g. 'Epic Name'"""
+        if self.field_ids is None:
+            self.field_ids = dict((x['name'], x['id']) for x in self.get_json('/rest/api/2/field'))
+        return self.field_ids.get(name)
+
+    def find_user(self, query):
+        """The user whose username, key or email is query
+
+        The user picker matches fuzzily (and display names are not unique), so
+        only a single exact match counts, however many users come back.
+        """
+        if query not in self.users:
+            jdata = self.get_json('/rest/api/2/user/picker', params={'query': query, 'maxResults': 10})
+            exact = [
+                x for x in jdata.get('users', [])
+                if query.lower() in [(x.get(k) or '').lower() for k in ('name', 'key', 'emailAddress')]
+            ]
+            self.users[query] = exact[0] if len(exact) == 1 else None
+        return self.users[query]
+
+    def search(self, jql, fields=None, page_size=SEARCH_PAGE_SIZE, workers=1):
+        """Yield every issue matching jql, walking startAt/total page by page
+
+        Only the given fields are requested. With workers > 1 up to that many pages
+        are in flight at once, but issues are still yielded in search order.
+        """
+        params = {'jql': jql, 'maxResults': page_size}
+        if fields:
+            params['fields'] = ','.join(fields)
+
+        def _page(start):
+            return self.get_json('/rest/api/2/search', params=dict(params, startAt=start))
+
+        first = _page(0)
+        yield from first['issues']
+
+        # the server may cap the page size below what was asked for
+        page_size = first.get('maxResults') or page_size
+        starts = iter(range(len(first['issues']), first['total'], page_size))
+
+        if workers <= 1:
+            for start in starts:
+                jdata = _page(start)
+                if not jdata['issues']:
+                    break
+                yield from jdata['issues']
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = collections.deque()
+            for start in starts:
+                pending.append(executor.submit(_page, start))
+                if len(pending) >= workers:
+                    break
+            while pending:
+                jdata = pending.popleft().result()
+                for start in starts:
+                    pending.append(executor.submit(_page, start))
+                    break
+                yield from jdata['issues']
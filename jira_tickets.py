@@ -8,31 +8,108 @@ can not generate tokens nor do advanced data import. This script works around al
 selenium to navigate through the pages and to input the data.
 """
 
+import argparse
 import copy
-import glob
 import json
 import os
+import queue
+import threading
 import time
 
-from pprint import pprint
-
 from logzero import logger
 from selenium import webdriver
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.common.action_chains import ActionChains
 
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 
 from webdriver_manager.firefox import GeckoDriverManager
 
+import metrics
+
+from issue_store import MIGRATE_LABEL, IssueStore, has_label, label_names, repo_from_url
+from http_client import backoff
+from form_fill import check_create_form, fill_comment, fill_create_form, read_create_form, set_issue_type
+from jira_backends import COMMENT_SECURITY_LEVEL, SECURITY_LEVEL, get_backend
+from jira_index import CommentIndex, JiraIndex, github_link, normalize_url
+from jira_rest import JiraREST
+from migration_journal import MigrationJournal
+from migration_plan import PLAN_FILE, is_empty, load_plan, make_plan, save_plan, summarize
+from repo_config import RepoConfig
+from user_cache import UserCache
+from waits import (
+    Waiter,
+    WaitTimeout,
+    clickable,
+    invisible,
+    modal_closed,
+    page_ready,
+    present,
+    stale,
+    visible
+)
+
 DATA_DIR = 'data'
 WAIT_SECONDS = 60
 
+# how many pages of jira search results to fetch at the same time
+SEARCH_WORKERS = int(os.environ.get('JIRA_SEARCH_WORKERS', 4))
+
+# how many logged in browser sessions migrate issues at the same time
+JIRA_WORKERS = int(os.environ.get('JIRA_WORKERS', 1))
+
+# create tickets in created_at order even with several sessions
+JIRA_ORDERED = os.environ.get('JIRA_ORDERED', '1') == '1'
+
+# run firefox without a window and without images, fonts, ...
+JIRA_HEADLESS = os.environ.get('JIRA_HEADLESS', '0') == '1'
+JIRA_LIGHT_PROFILE = os.environ.get('JIRA_LIGHT_PROFILE', '1') == '1'
+
+# the cookies of the last sso login, reused until jira rejects them
+SESSION_FILE = os.path.join(DATA_DIR, 'jira', '.session_cookies.json')
+SESSION_COOKIE_KEYS = ('name', 'value', 'path', 'domain', 'secure', 'httpOnly', 'expiry')
+
+# github login -> jira username or email, written by map_logins.py
+LOGIN_MAP_FILE = os.path.join(DATA_DIR, 'github', 'login_map.json')
+
+# selenium clicks through the ui, rest posts to the api with the sso session
+JIRA_BACKEND = os.environ.get('JIRA_BACKEND', 'selenium')
+
+# how many created tickets go by between rewrites of the cached ticket files,
+# the journal has them in the meantime and they are written at the end of a run
+JIRA_SAVE_EVERY = 50
+
 
 class CommentFailedRetryException(Exception):
-    pass
+
+    def __init__(self, message, submitted=False):
+        super(CommentFailedRetryException, self).__init__(message)
+        # the comment may have been saved despite the failure
+        self.submitted = submitted
+
+
+class OrderedGate(object):
+
+    """Let numbered steps from several threads pass strictly in order"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.next = 0
+        self.finished = set()
+
+    def wait(self, seq):
+        with self.cond:
+            while self.next < seq:
+                self.cond.wait()
+
+    def done(self, seq):
+        with self.cond:
+            # steps can finish out of order (e.g. skipped before they waited),
+            # the gate only moves past an unbroken run of finished ones
+            if seq >= self.next:
+                self.finished.add(seq)
+            while self.next in self.finished:
+                self.finished.remove(self.next)
+                self.next += 1
+            self.cond.notify_all()
 
 
 def highlight(driver, element):
@@ -73,16 +150,17 @@ class JiraWrapper:
     iurl = 'https://issues.redhat.com/projects/AA/issues/AA-1?filter=allopenissues'
 
     login_map = None
+    users = None
     github_issues = None
+    store = None
     jira_issues = None
-    imap = None
+    jira_index = None
+    comment_index = None
+    journal = None
+    plan = None
+    repo_config = None
 
-    private_repos = {
-        'https://api.github.com/repos/RedHatInsights/tower-analytics-backend': True,
-        'https://api.github.com/repos/RedHatInsights/tower-analytics-frontend': False
-    }
-
-    def __init__(self, url, username, password):
+    def __init__(self, url, username, password, backend=JIRA_BACKEND, workers=JIRA_WORKERS, plan=None):
 
         if not username or not password:
             raise Exception('The username and password must be set!')
@@ -91,56 +169,83 @@ class JiraWrapper:
         self.username = username
         self.password = password
         self.driver = None
-
-        self.load_imap()
+        self.rest = None
+        self.backend = get_backend(backend, self)
+        self.workers = max(1, workers)
+        # guards the cached ticket list and its files across sessions
+        self.jira_lock = threading.Lock()
+        self.plan = plan
+        # privacy and component of each repo
+        self.repo_config = RepoConfig.load()
+
+        self.load_journal()
         self.load_login_map()
         self.load_github_data()
-
-        self.connect()
-        self.scrape_jira_issues()
+        self.import_lockfiles()
+        self.apply_plan()
+
+        with metrics.timer('jira_step_seconds', step='login'):
+            self.connect()
+        with metrics.timer('jira_step_seconds', step='scrape'):
+            self.scrape_jira_issues()
+        self.resolve_users()
+        metrics.export('jira_scrape')
         #self.jira_issues = []
         #self.create_test_issue()
         self.create_issues()
+        self.journal.close()
+        metrics.export('jira_migrate')
+
+    def load_journal(self):
+        self.journal = MigrationJournal(os.path.join(DATA_DIR, 'jira', 'migration_journal.jsonl'))
 
-    def load_imap(self):
-        fn = '.jiramap.json'
-        if os.path.exists(fn):
-            with open(fn, 'r') as f:
-                self.imap = json.loads(f.read())
-    
-    def save_imap(self):
-        fn = '.jiramap.json'
-        with open(fn, 'w') as f:
-            f.write(json.dumps(self.imap))
+    def import_lockfiles(self):
+        """Carry the <issue>.lock markers of older runs over into a new journal"""
+        if self.journal.existed:
+            return
+        for gi in self.github_issues:
+            if os.path.exists(gi[-1] + '.lock'):
+                idata = self.store.get_issue(repo_from_url(gi[1]), gi[2])
+                self.journal.issue_done(idata['html_url'], None)
+        self.journal.sync()
 
     def load_login_map(self):
         self.login_map = {}
-        fn = 'login_map.json'
-        if os.path.exists(fn):
-            with open(fn, 'r') as f:
-                self.login_map = json.loads(f.read())
-
-    def load_github_data(self):
+        # older checkouts kept the map next to the scripts
+        for fn in [LOGIN_MAP_FILE, 'login_map.json']:
+            if os.path.exists(fn):
+                with open(fn, 'r') as f:
+                    self.login_map = json.loads(f.read())
+                break
 
-        self.github_issues = []
+    def resolve_users(self):
+        """Look up the jira user of every github author not looked up before"""
+        self.users = UserCache()
+        self.users.resolve(self.rest, self.store.authors(comments=True), login_map=self.login_map)
 
-        #ddir = os.path.abspath('./data')
-        ifiles = glob.glob(f"{DATA_DIR}/github/*/*/*_issue.json")
+    def reporter_for(self, issue_data):
+        """The resolved jira user for the author of an issue, or None"""
+        return self.users.get(issue_data['user']['login'])
 
-        ikeys = []
-        for ifile in ifiles:
-            with open(ifile, 'r') as f:
-                idata = json.loads(f.read())
-            labels = [x['name'] for x in idata['labels']]
-            if 'JIRA' not in labels:
-                continue
-            
-            ikey = [idata['created_at'], idata['repository_url'], idata['number'], ifile]
-            ikeys .append(ikey)
+    def load_github_data(self):
 
-        ikeys = sorted(ikeys, key=lambda x: x[0])
-        self.github_issues = ikeys[:]
+        self.github_issues = []
 
+        # the store keeps itself in sync with the files on disk and
+        # hands back [created_at, repository_url, number, ifile] sorted
+        self.store = IssueStore(os.path.join(DATA_DIR, 'github', 'issues.sqlite'))
+        self.store.import_tree(os.path.join(DATA_DIR, 'github'))
+        self.github_issues = self.store.issues_with_label(MIGRATE_LABEL)
+
+    def apply_plan(self):
+        """Only work on the issues the plan has tickets or comments to add for"""
+        if self.plan is None:
+            return
+        planned = set(
+            (x['repository_url'], x['number']) for x in self.plan['create'] + self.plan['comment']
+        )
+        self.github_issues = [x for x in self.github_issues if (x[1], x[2]) in planned]
+        logger.info(f'{len(self.github_issues)} issues to migrate according to the plan')
 
     def connect(self):
 
@@ -152,15 +257,33 @@ class JiraWrapper:
         options.set_preference("devtools.jsonview.enabled", False)
         options.add_argument("-private")
 
+        if JIRA_HEADLESS:
+            options.headless = True
+
         profile = webdriver.FirefoxProfile()
         profile.set_preference("browser.privatebrowsing.autostart", True)
 
+        if JIRA_LIGHT_PROFILE:
+            # nothing the scripts look at needs images, web fonts or prefetching,
+            # stylesheets stay on because the visibility waits depend on them
+            profile.set_preference("permissions.default.image", 2)
+            profile.set_preference("browser.display.use_document_fonts", 0)
+            profile.set_preference("gfx.downloadable_fonts.enabled", False)
+            profile.set_preference("network.prefetch-next", False)
+            profile.set_preference("network.dns.disablePrefetch", True)
+            profile.set_preference("media.autoplay.default", 5)
+
         # create the driver with driver manager ...
         self.driver = webdriver.Firefox(
             executable_path=GeckoDriverManager().install(),
             options=options,
             firefox_profile=profile
         )
+        self.waiter = Waiter(self.driver, timeout=WAIT_SECONDS)
+
+        if self.restore_session():
+            logger.info('reusing the saved sso session ...')
+            return
 
         self.driver.get(self.url)
 
@@ -181,14 +304,8 @@ class JiraWrapper:
         '''
 
         # wait for username ...
-        WebDriverWait(self.driver, WAIT_SECONDS).until(
-            EC.visibility_of_element_located((By.ID, 'username'))
-        )
-
-        # enter username
         logger.info('enter username ...')
-        self.wait_for_element(id='username')
-        un = self.driver.find_element_by_id('username')
+        un = self.wait_for_element(id='username')
         un.send_keys(self.username)
 
         # next button
@@ -198,16 +315,14 @@ class JiraWrapper:
 
         # enter password
         logger.info('enter password ...')
-        self.wait_for_element(id='password')
-        pw = self.driver.find_element_by_id('password')
+        pw = self.wait_for_element(id='password')
         pw.send_keys(self.password)
 
         # click login
         logger.info('click login ...')
-        self.wait_for_element(id='kc-login')
-        loginb = self.driver.find_element_by_id('kc-login')
+        loginb = self.waiter.until(clickable(By.ID, 'kc-login'), 'login button')
         loginb.click()
-        time.sleep(5)
+        self.waiter.until(invisible(By.ID, 'kc-login'), 'sso login done')
 
         # go back to issues page
         logger.info('go back to url ...')
@@ -218,154 +333,317 @@ class JiraWrapper:
             logger.info('click login again ...')
             login_url = self.driver.find_element_by_class_name('login-link')
             login_url.click()
-            time.sleep(5)
+            self.waiter.until(invisible(By.CLASS_NAME, 'login-link'), 'jira login done')
 
-        #import epdb; epdb.st()
+        # reuse the sso session for rest api reads ...
+        self.rest = JiraREST(self.url)
+        self.rest.load_cookies(self.driver.get_cookies())
+        self.save_session()
 
+        #import epdb; epdb.st()
 
-    def scrape_jira_issues(self, github_issue_to_find=None):
-
-        def _scrape():
-            self.jira_issues = []
-            self.driver.get('https://issues.redhat.com/rest/api/2/search?jql=project=AA&maxResults=1000')
-            data = self.driver.find_element_by_tag_name('pre').text
-            jdata = json.loads(data)
-            issues = jdata['issues']
-
-            for ji in issues:
-                idata = {
-                    'github_link': None,
-                    'number': ji['key'],
-                    'api_url': ji['self'],
-                    'url': 'https://issues.redhat.com/projects/AA/issues/' + ji['key'],
-                    'description': ji['fields']['description'] or ''
-                }
-
-                '''
-                self.driver.get(ji['self'])
-                idata = self.driver.find_element_by_tag_name('pre').text
-                ijdata = json.loads(data)
-                import epdb; epdb.st()
-                '''
-
-                if 'https://github.com' in idata['description'].split('\n')[0]:
-                    lines = idata['description'].split('\n')
-                    idata['github_link'] = lines[0].strip()
-
-                    if 'http' not in idata['github_link']:
-                        pprint(idata)
-                        import epdb; epdb.st()
-
-                self.jira_issues.append(idata)
-
-            dn = os.path.join(DATA_DIR, 'jira')
+    def save_session(self):
+        with self.jira_lock:
+            dn = os.path.dirname(SESSION_FILE)
             if not os.path.exists(dn):
                 os.makedirs(dn)
-            with open(os.path.join(dn, 'AA_jira_tickets.json'), 'w') as f:
-                f.write(json.dumps(self.jira_issues, indent=2, sort_keys=True))
-
-        _scrape()
-        if github_issue_to_find:
-            matches = [x for x in self.jira_issues if github_issue_to_find in x]
-            while not matches:
-                logger.info(f'waiting for {github_issue_to_find} to appaer')
-                _scrape()
-                matches = [x for x in self.jira_issues if github_issue_to_find in x['description']]
-                if not matches:
-                    time.sleep(2)
+            fd = os.open(SESSION_FILE + '.tmp', os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                f.write(json.dumps(self.driver.get_cookies()))
+            os.replace(SESSION_FILE + '.tmp', SESSION_FILE)
+
+    def restore_session(self):
+        """Load the cookies of a previous login and check that jira still accepts them"""
+        if not os.path.exists(SESSION_FILE):
+            return False
+        with open(SESSION_FILE, 'r') as f:
+            cookies = json.loads(f.read())
+
+        self.rest = JiraREST(self.url)
+        self.rest.load_cookies(cookies)
+        try:
+            self.rest.get_json('/rest/api/2/myself')
+        except Exception as e:
+            logger.info(f'saved sso session is no longer valid: {e}')
+            self.rest = None
+            return False
+
+        # cookies can only be set for the domain of the current page
+        self.driver.get(self.url + '/robots.txt')
+        host = self.url.split('://')[-1].split('/')[0]
+        for cookie in cookies:
+            if not host.endswith(cookie.get('domain', host).lstrip('.')):
+                continue
+            cookie = dict((k, v) for k, v in cookie.items() if k in SESSION_COOKIE_KEYS)
+            self.driver.add_cookie(cookie)
+        self.driver.get(self.url)
+        return True
+
+
+    def make_jira_record(self, ji):
+        idata = {
+            'github_link': None,
+            'number': ji['key'],
+            'api_url': ji['self'],
+            'url': 'https://issues.redhat.com/projects/AA/issues/' + ji['key'],
+            'description': ji['fields']['description'] or ''
+        }
+        idata['github_link'] = github_link(idata['description'])
+        return idata
+
+    def save_jira_issues(self):
+        dn = os.path.join(DATA_DIR, 'jira')
+        if not os.path.exists(dn):
+            os.makedirs(dn)
+        with open(os.path.join(dn, 'AA_jira_tickets.json'), 'w') as f:
+            f.write(json.dumps(self.jira_issues, indent=2, sort_keys=True))
+        self.jira_index.save(os.path.join(dn, 'AA_jira_index.json'))
+
+    def save_comment_index(self):
+        self.comment_index.save(os.path.join(DATA_DIR, 'jira', 'AA_comment_index.json'))
+
+    def add_jira_record(self, idata):
+        """Merge a newly created ticket into the cached tickets, the files follow in batches"""
+        with self.jira_lock:
+            self.jira_issues.append(idata)
+            self.jira_index.add(idata)
+            if len(self.jira_issues) % JIRA_SAVE_EVERY == 0:
+                self.save_jira_issues()
+        return self.jira_index.get(idata['github_link'])
+
+    def save_jira_records(self):
+        with self.jira_lock:
+            self.save_jira_issues()
+
+    def scrape_jira_issues(self):
+
+        self.jira_issues = []
+        self.jira_index = JiraIndex()
+        self.comment_index = CommentIndex()
+        issues = self.rest.search('project=AA', fields=['description', 'comment'], workers=SEARCH_WORKERS)
+
+        for ji in issues:
+            idata = self.make_jira_record(ji)
+            self.jira_issues.append(idata)
+            self.jira_index.add(idata)
+
+            # the search only embeds the first page of comments
+            comments = ji['fields']['comment']['comments']
+            bodies = [x['body'] for x in comments]
+            if ji['fields']['comment']['total'] > len(comments):
+                bodies += [x['body'] for x in self.rest.iter_comments(ji['key'], start=len(comments))]
+            self.comment_index.add_bodies(ji['key'], bodies)
+
+        # comments posted by an earlier run that the search may not show yet
+        for key, urls in self.journal.posted_comments().items():
+            for url in urls:
+                self.comment_index.add(key, url)
+
+        self.save_jira_issues()
+        self.save_comment_index()
 
         logger.info('opening ' + self.iurl)
         self.driver.get(self.iurl)
         self.wait_for_element(classname="simple-issue-list")
 
+    def find_created_issue(self, github_url, started, retries=10):
+        """Find the ticket just created for github_url and merge it into the cached tickets
+
+        Only tickets created since the create form was submitted are searched, newest first,
+        instead of downloading the whole project again.
+        """
+        with metrics.timer('jira_step_seconds', step='verify'):
+            return self._find_created_issue(github_url, started, retries)
+
+    def _find_created_issue(self, github_url, started, retries):
+        minutes = int((time.time() - started) / 60) + 2
+        jql = f'project=AA AND created >= -{minutes}m ORDER BY key DESC'
+        for attempt in range(1, retries + 1):
+            for ji in self.rest.search(jql, fields=['description'], page_size=50):
+                idata = self.make_jira_record(ji)
+                if idata['github_link'] and normalize_url(idata['github_link']) == normalize_url(github_url):
+                    return self.add_jira_record(idata)
+
+            rt = backoff(attempt, base=0.5, cap=10)
+            logger.info(f'waiting {rt:.1f}s for {github_url} to appear')
+            time.sleep(rt)
 
-    def get_comments_for_issue(self, api_url):
-        self.driver.get(api_url)
-        data = self.driver.find_element_by_tag_name('pre').text
-        jdata = json.loads(data)
-        comments = jdata['fields']['comment']['comments']
-        return comments
+        return None
 
     def create_issues(self):
-        logger.info('opening ' + self.iurl)
-        self.driver.get(self.iurl)
-        self.wait_for_element(classname="simple-issue-list")
+        try:
+            if self.workers > 1:
+                return self.create_issues_parallel()
+
+            logger.info('opening ' + self.iurl)
+            self.driver.get(self.iurl)
+            self.wait_for_element(classname="simple-issue-list")
+
+            for gi in self.github_issues:
+                self.migrate_issue(gi)
+            self.waiter.log_stats()
+        finally:
+            self.save_jira_records()
+            self.save_comment_index()
+
+    def create_issues_parallel(self):
+        """Migrate the github issues with a pool of logged in browser sessions
+
+        Each session claims the next issue from a shared queue. Unless JIRA_ORDERED
+        is turned off, tickets are still created in created_at order, only the
+        comments of different issues are added at the same time.
+        """
+        issues = queue.Queue()
+        for seq, gi in enumerate(self.github_issues):
+            issues.put((seq, gi))
 
-        total = 0
-        for gi in self.github_issues:
+        gate = OrderedGate() if JIRA_ORDERED else None
+
+        def _work(worker):
+            while True:
+                try:
+                    seq, gi = issues.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    worker.migrate_issue(gi, gate=gate, seq=seq)
+                except Exception as e:
+                    logger.exception(e)
+
+        workers = [self]
+        for x in range(1, self.workers):
+            workers.append(self.spawn_worker())
+
+        threads = [threading.Thread(target=_work, args=(x,)) for x in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for worker in workers:
+            worker.waiter.log_stats()
+        for worker in workers[1:]:
+            worker.driver.quit()
+
+    def spawn_worker(self):
+        """Another logged in browser session sharing this wrapper's data"""
+        worker = copy.copy(self)
+        worker.backend = get_backend(self.backend.name, worker)
+        with metrics.timer('jira_step_seconds', step='login'):
+            worker.connect()
+        return worker
+
+    def refresh_comments(self, ticket):
+        """Re-read the comments of one ticket into the comment index"""
+        bodies = [x['body'] for x in self.rest.iter_comments(ticket['number'])]
+        self.comment_index.add_bodies(ticket['number'], bodies)
+
+    def record_comment(self, ticket, cd):
+        self.comment_index.add(ticket['number'], cd['html_url'])
+        self.journal.comment_posted(ticket['number'], cd['html_url'])
+        metrics.inc('jira_comments_total', backend=self.backend.name)
+
+    def migrate_issue(self, gi, gate=None, seq=None):
+        try:
+            with metrics.timer('jira_step_seconds', step='issue'):
+                self._migrate_issue(gi, gate, seq)
+        finally:
+            # never leave the next issue waiting on this one
+            if gate is not None:
+                gate.done(seq)
 
-            logger.info(gi)
-            lockfile = gi[-1] + '.lock'
-            with open(gi[-1], 'r') as f:
-                idata = json.loads(f.read())
+    def _migrate_issue(self, gi, gate, seq):
 
-            lnames = [x['name'].lower() for x in idata['labels']]
+        logger.info(gi)
+        repo = repo_from_url(gi[1])
+        idata = self.store.get_issue(repo, gi[2])
 
-            if 'jira' not in lnames:
-                continue
+        lnames = label_names(idata)
 
-            #if idata['number'] == 313:
-            #    import epdb; epdb.st()
+        if not has_label(idata, MIGRATE_LABEL):
+            return
 
-            if os.path.exists(lockfile):
-                continue
+        #if idata['number'] == 313:
+        #    import epdb; epdb.st()
 
-            '''
-            total += 1
-            if total >= 10:
-                break
-            '''
-
-            itype = 'Bug'
-            if 'epic' in lnames:
-                itype = 'Epic'
-            elif 'feature' in lnames or 'enhancement' in lnames:
-                itype = 'Feature'
-            
-            #matches = [x for x in self.jira_issues if idata['html_url'] in x['description']]
-            matches = [x for x in self.jira_issues if idata['html_url'] in x['description'].split('\n')[0]]
-            if not matches:
+        # a plan also lists finished issues that got new comments since
+        if self.plan is None and self.journal.is_done(idata['html_url']):
+            return
+
+        itype = 'Bug'
+        if 'epic' in lnames:
+            itype = 'Epic'
+        elif 'feature' in lnames or 'enhancement' in lnames:
+            itype = 'Feature'
+
+        if gate is not None:
+            gate.wait(seq)
+
+        try:
+            ticket = self.jira_index.get(idata['html_url'])
+            if not ticket:
 
                 #import epdb; epdb.st()
 
-                self.create_issue(
+                ticket = self.backend.create_issue(
                     idata,
                     itype=itype,
-                    private=self.private_repos.get(idata['repository_url'])
+                    private=self.repo_config.private(idata['repository_url'])
                 )
-                self.scrape_jira_issues(github_issue_to_find=idata['html_url'])
-                #matches = [x for x in self.jira_issues if idata['html_url'] in x['description']]
-                #import epdb; epdb.st()
-                #assert matches, "The newly created issue was not found"
-                matches = [x for x in self.jira_issues if idata['html_url'] in x['description']]
-                assert matches, "The newly created issue was not found"
-            
-            cfile = gi[-1].replace('_issue', '_comments')
-            with open(cfile, 'r') as f:
-                cdata = json.loads(f.read())
-            if cdata:
-                comments_success = False
-                for retry in range(0, 10):
-                    try:
-                        self.create_comments(
-                            matches[0],
-                            cdata,
-                            private=self.private_repos.get(idata['repository_url'])
-                        )
-                        comments_success = True
-                        break
-                    except CommentFailedRetryException as e:
-                        print(e)
-                        time.sleep(1)
-                if not comments_success:
-                    logger.error('creating comments failed ...')
-                    import epdb; epdb.st()
-               
-            # stop after each issue ...
-            with open(lockfile, 'w') as f:
-                f.write('')
-            #import epdb; epdb.st()
-            time.sleep(2)
+                assert ticket, "The newly created issue was not found"
+                self.journal.issue_created(idata['html_url'], ticket['number'])
+                metrics.inc('jira_tickets_total', backend=self.backend.name, itype=itype)
+        finally:
+            # the comments do not need to wait for each other
+            if gate is not None:
+                gate.done(seq)
+
+        cdata = self.store.get_comments(repo, gi[2])
+        if cdata:
+            comments_success = False
+            for retry in range(0, 10):
+                try:
+                    self.backend.create_comments(
+                        ticket,
+                        cdata,
+                        private=self.repo_config.private(idata['repository_url'])
+                    )
+                    comments_success = True
+                    break
+                except CommentFailedRetryException as e:
+                    print(e)
+                    metrics.inc('jira_comment_retries_total')
+                    self.waiter.until(page_ready(), 'page ready for comment retry')
+                    if e.submitted:
+                        # don't post it twice if it was saved after all
+                        self.refresh_comments(ticket)
+            if not comments_success:
+                logger.error('creating comments failed ...')
+                import epdb; epdb.st()
+
+        # stop after each issue ...
+        self.journal.issue_done(idata['html_url'], ticket['number'])
+        #import epdb; epdb.st()
+
+    def component_for(self, issue_data):
+        return self.repo_config.component(issue_data['repository_url'])
+
+    def summary_for(self, issue_data):
+        component = self.component_for(issue_data)
+        if component:
+            return component + '-' + str(issue_data['number']) + ': ' + issue_data['title']
+        return issue_data['title']
+
+    @staticmethod
+    def description_for(issue_data):
+        return issue_data['html_url'] + '\n\n' + (issue_data['body'] or '')
+
+    @staticmethod
+    def comment_body(cd):
+        body = cd['html_url'] + '\n'
+        body +=  cd['created_at'] + ' by ' + '@' + cd['user']['login'] + '\n\n'
+        body += cd['body'] + ' '
+        return body
 
     def create_issue(self, issue_data, private=False, itype='Bug'):
         self.driver.get(self.iurl)
@@ -412,160 +690,79 @@ class JiraWrapper:
         """
 
         # wait for the create button ...
-        WebDriverWait(self.driver, WAIT_SECONDS).until(
-            EC.visibility_of_element_located((By.ID, 'create_link'))
-        )
-        self.driver.find_element_by_id('create_link').click()
-        #import epdb; epdb.st()
-        
-        # find description box and fill it in ...
-        logger.info('wait for modal ...')
-        new_description = issue_data['html_url'] + '\n\n' + issue_data['body']
-        self.wait_for_element(classname='description-wiki-edit')
-
-        logger.info('brute force filling in the description ...')
-        count = 0
-        while True:
-            '''
-            try:
-                highlight(self.driver, self.driver.find_element_by_id('description-wiki-edit'))
-                highlight(self.driver, self.driver.find_element_by_id('description-wiki-edit').find_element_by_tag_name('textarea'))
-            except Exception as e:
-                logger.error(str(e))
-            '''
-
-            try:
-                delete_element(self.driver, self.driver.find_element_by_class_name('rte-container'))
-                ta = self.driver.find_element_by_id('description-wiki-edit').find_element_by_tag_name('textarea')
-                hover = ActionChains(self.driver).move_to_element(ta)
-                ta.click()
-                self.driver.find_element_by_id('description-wiki-edit').find_element_by_tag_name('textarea').send_keys(new_description)
-                break
-            except Exception as e:
-                logger.error(str(e))
+        with metrics.timer('jira_step_seconds', step='create_modal'):
+            self.waiter.until(clickable(By.ID, 'create_link'), 'create button').click()
+            #import epdb; epdb.st()
 
-            count += 1
-            if count >= 5:
-                break
-            time.sleep(count)
+            # fill the whole form in a couple of scripts ...
+            logger.info('wait for modal ...')
+            self.waiter.until(present(By.ID, 'issuetype'), 'create modal')
+            summary = self.waiter.until(present(By.ID, 'summary'), 'create modal')
+        fill_started = time.time()
 
-        # set the issue type ...
+        # changing the type reloads the rest of the form, so it goes first
         logger.info('set the issue type')
-        self.wait_for_element(id='issuetype-single-select')
-        for x in range(0, 10):
-            self.driver.find_element_by_id('issuetype-single-select').find_element_by_tag_name('input').send_keys(Keys.BACKSPACE)
-        self.driver.find_element_by_id('issuetype-single-select').find_element_by_tag_name('input').send_keys(itype)
-        self.driver.find_element_by_id('issuetype-single-select').find_element_by_tag_name('input').send_keys(Keys.TAB)
-        #time.sleep(2)
-        time.sleep(1)
-
-        # set the security level ...
-        if private:
-            logger.info('set security level')
-            sselect = self.driver.find_element_by_id('security')
-            sopts = self.driver.find_elements_by_tag_name('option')
-            for sopt in sopts:
-                if 'Red Hat Internal' in sopt.text:
-                    sopt.click()
-                    break
-            #time.sleep(2)
-            time.sleep(1)
-        
-        # set the component ...
-        logger.info('set components')
-        cdiv = self.driver.find_element_by_id('components-multi-select')
-        try:
-            for x in range(0, 10):
-                cdiv.find_element_by_tag_name('textarea').send_keys(Keys.BACKSPACE)
-        except Exception as e:
-            logger.error(e)
-            import epdb; epdb.st()
-        if 'backend' in issue_data['url']:
-            cdiv.find_element_by_tag_name('textarea').send_keys('API')
-        elif 'frontend' in issue_data['url']:
-            cdiv.find_element_by_tag_name('textarea').send_keys('UI')
-        cdiv.find_element_by_tag_name('textarea').send_keys(Keys.TAB)
-        #time.sleep(5)
-        time.sleep(1)
-        
-        # set the summary/title
-        new_summary = issue_data['title']
-        if 'backend' in issue_data['url']:
-            new_summary = 'API-' + str(issue_data['number']) + ': ' + new_summary
-        elif 'frontend' in issue_data['url']:
-            new_summary = 'UI-' + str(issue_data['number']) + ': ' + new_summary
-  
-        logger.info('fill in summary')
-        self.driver.find_element_by_id('summary').send_keys(new_summary)
-        if itype == 'Epic':
-            logger.info('fill in epic name')
-            field_groups = self.driver.find_elements_by_class_name('field-group')
-            field_groups = [x for x in field_groups if 'Epic Name' in x.text]
-            epic_field = field_groups[0]
-            #epic_field.send_keys(new_summary)
-            epic_field.find_element_by_tag_name('input').send_keys(new_summary)
-
-
-        # set the reporter ...
-        rname = self.login_map.get(issue_data['user']['login'])
-        if rname:
-            self.driver.find_element_by_id('reporter-field').send_keys(Keys.BACKSPACE * 20)
-            self.driver.find_element_by_id('reporter-field').send_keys(rname + Keys.TAB)
-            time.sleep(1)
-            self.driver.find_element_by_id('reporter-field').send_keys(Keys.TAB)
+        if set_issue_type(self.driver, itype) == 'changed':
+            try:
+                self.waiter.until(stale(summary), 'form reload', timeout=10)
+            except WaitTimeout:
+                pass
+            self.waiter.until(clickable(By.ID, 'summary'), 'form reload')
+
+        new_summary = self.summary_for(issue_data)
+        reporter = self.reporter_for(issue_data)
+        fields = {
+            'summary': new_summary,
+            'description': self.description_for(issue_data),
+            'components': [x for x in [self.component_for(issue_data)] if x],
+            'security': SECURITY_LEVEL if private else None,
+            'epic_name': new_summary if itype == 'Epic' else None,
+            'reporter': {'name': reporter['name'], 'display': reporter['display']} if reporter else None
+        }
+        logger.info('fill in the form')
+        missing = fill_create_form(self.driver, fields)
+        if missing:
+            logger.error(f'create form is missing {missing}')
+
+        wrong = check_create_form(read_create_form(self.driver), fields, itype)
+        if wrong:
+            raise Exception(f'create form did not take {wrong}')
 
         #import epdb; epdb.st()
 
+        metrics.observe('jira_step_seconds', time.time() - fill_started, step='form_fill')
+
         #import epdb; epdb.st()
         logger.info('click create')
-        try:
-            self.driver.find_element_by_id('create-issue-submit').click()
-        except Exception as e:
-            logger.error(str(e))
+        with metrics.timer('jira_step_seconds', step='submit'):
+            try:
+                self.driver.find_element_by_id('create-issue-submit').click()
+            except Exception as e:
+                logger.error(str(e))
+            self.waiter.until(modal_closed(), 'create modal closed')
 
         #import epdb; epdb.st()
 
 
     def create_comments(self, ticket, cdata, private=False):
 
-        # fetch comments from the API to avoid mucking with button clicking
-        existing = self.get_comments_for_issue(ticket['api_url'])
-        joined_bodies = '\n'.join([x['body'] for x in existing])
-
         # open the issue ..
         # iurl = 'https://issues.redhat.com/projects/AA/issues/AA-1?filter=allopenissues'
         self.driver.get(ticket['url'])
-        time.sleep(2)
 
         for cd in cdata:
 
             # skip if already added (according to API data)...
-            if cd['html_url'] in joined_bodies:
+            if self.comment_index.has(ticket['number'], cd['html_url']):
                 continue
 
             logger.info('adding comment ' + cd['html_url'])
+            started = time.time()
 
-            body = cd['html_url'] + '\n'
-            body +=  cd['created_at'] + ' by ' + '@' + cd['user']['login'] + '\n\n'
-            body += cd['body'] + ' '
-
-            # @trahman73 is problematic for the javascript ...
-            breakers = [
-                'benthomasson',
-                'chambridge',
-                'trahman73',
-                'wenottingham',
-                'log_stream',
-                'ladas',
-                'Ladas'
-            ]
-            for breaker in breakers:
-                body = body.replace('@' + breaker, breaker)
+            body = self.comment_body(cd)
 
             # click the comment button at the top OR at the bottom ...
-            WebDriverWait(self.driver, WAIT_SECONDS).until(
-                EC.visibility_of_element_located((By.ID, 'comment-issue'))
-            )
+            self.wait_for_element(id='comment-issue')
             new_clicked = False
             comment_button_ids = ['comment-issue', 'footer-comment-button']
             for cbid in comment_button_ids:
@@ -579,60 +776,11 @@ class JiraWrapper:
             if not new_clicked:
                 import epdb; epdb.st()
 
-            WebDriverWait(self.driver, WAIT_SECONDS).until(
-                EC.visibility_of_element_located((By.ID, 'comment-wiki-edit'))
-            )
-            WebDriverWait(self.driver, WAIT_SECONDS).until(
-                EC.visibility_of_element_located((By.TAG_NAME, 'iframe'))
-            )
-            iframes = self.driver.find_elements_by_tag_name('iframe')
-            if iframes:
-                valid_frames = [x for x in iframes if x.get_attribute('id')]
-                last_iframe = valid_frames[-1]
-                last_iframe_id = last_iframe.get_attribute('id')
-                cids = [last_iframe_id, 'comment']
-            else:
-                cids = ['comment']
-
-            commented = False
-            for cid in cids:
-                try:
-                    self.driver.find_element_by_id('comment-wiki-edit').find_element_by_id(cid).click()
-                    self.driver.find_element_by_id('comment-wiki-edit').find_element_by_id(cid).send_keys(body)
-                    commented = True
-                    break
-                except Exception as e:
-                    logger.error(e)
-
-            if not commented:
-                logger.error('could not type comment ...')
-                raise CommentFailedRetryException('could not type comment')
-
-            #panel = self.driver.find_element_by_class_name('detail-panel')
-            #self.driver.execute_script("arguments[0].scrollTo(0, 100000);", panel)                
-
-            # change the visibility ...
-            if private:
-                logger.info('expand security options ...')
-                try:
-                    sl = self.driver.find_element_by_class_name('security-level')
-                    sl.find_element_by_id('commentLevel-multi-select').click()
-                except Exception as e:
-                    logger.error(e)
-                    #import epdb; epdb.st()
-                    raise CommentFailedRetryException('could click security level')
-
-                logger.info('click redhat ...')
-                try:
-                    #self.driver.find_element_by_class_name('aui-list-item-li-red-hat-employee').click()
-                    #self.driver.find_element_by_class_name('security-level').find_element_by_class_name('aui-list-item-li-red-hat-employee').click()
-                    self.driver.find_element_by_class_name('aui-list-scroll').send_keys(Keys.DOWN * 6)
-                    self.driver.find_element_by_class_name('aui-list-scroll').send_keys(Keys.ENTER)
-                    time.sleep(1)
-                except Exception as e:
-                    logger.error(e)
-                    #import epdb; epdb.st()
-                    raise CommentFailedRetryException('could not choose redhat')
+            self.wait_for_element(id='comment-wiki-edit')
+            missing = fill_comment(self.driver, body, COMMENT_SECURITY_LEVEL if private else None)
+            if missing:
+                logger.error(f'comment form is missing {missing}')
+                raise CommentFailedRetryException('could not fill in comment')
 
             # click "add"
             try:
@@ -641,43 +789,75 @@ class JiraWrapper:
                 logger.error(str(e))
                 raise CommentFailedRetryException('could not click submit')
 
+            try:
+                self.waiter.until(invisible(By.ID, 'comment-wiki-edit'), 'comment saved')
+            except WaitTimeout:
+                raise CommentFailedRetryException('comment form did not close', submitted=True)
+            self.record_comment(ticket, cd)
+            metrics.observe('jira_step_seconds', time.time() - started, step='comment')
+
         #import epdb; epdb.st()
 
+    @staticmethod
+    def _locator(id=None, classname=None, selector=None):
+        if id:
+            return (By.ID, id)
+        elif classname:
+            return (By.CLASS_NAME, classname)
+        return (By.CSS_SELECTOR, selector)
+
     def check_element(self, id=None, classname=None, selector=None):
+        by, value = self._locator(id=id, classname=classname, selector=selector)
         try:
-            if id:
-                self.driver.get_element_by_id(id)
-            elif classname:
-                self.driver.get_element_by_class_name(classname)
-            elif selector:
-                pass
-            return True
+            return any(x.is_displayed() for x in self.driver.find_elements(by, value))
         except Exception as e:
             pass
         return False
 
-
-    def wait_for_element(self, id=None, classname=None, selector=None):
-        count = 0
-        while True:
-            count += 1
-            logger.info(f'poll for {id} {count} ...')
-            try:
-                if id:
-                    self.driver.get_element_by_id(id)
-                elif classname:
-                    self.driver.get_element_by_class_name(classname)
-                elif selector:
-                    pass
-            except Exception as e:
-                time.sleep(2)
-            break
-
+    def wait_for_element(self, id=None, classname=None, selector=None, timeout=None):
+        by, value = self._locator(id=id, classname=classname, selector=selector)
+        logger.info(f'wait for {value} ...')
+        return self.waiter.until(visible(by, value), value, timeout=timeout)
 
 
 
 def main():
-    jw = JiraWrapper('https://issues.redhat.com', os.environ.get('JIRA_USERNAME'), os.environ.get('JIRA_PASSWORD'))
+    parser = argparse.ArgumentParser(description='copy the github issues labeled JIRA to issues.redhat.com')
+    parser.add_argument(
+        'command',
+        nargs='?',
+        default='apply',
+        choices=['plan', 'apply'],
+        help='plan: only write the work list, apply: plan and migrate (default)'
+    )
+    parser.add_argument('--plan-file', default=PLAN_FILE)
+    parser.add_argument(
+        '--from-plan',
+        action='store_true',
+        help='apply the saved plan file instead of computing a new one'
+    )
+    args = parser.parse_args()
+
+    if args.command == 'apply' and args.from_plan:
+        plan = load_plan(args.plan_file)
+    else:
+        plan = make_plan(DATA_DIR)
+        save_plan(plan, args.plan_file)
+
+    if args.command == 'plan':
+        print(summarize(plan))
+        return
+
+    if is_empty(plan):
+        logger.info('nothing to create or comment on, not starting a browser')
+        return
+
+    jw = JiraWrapper(
+        'https://issues.redhat.com',
+        os.environ.get('JIRA_USERNAME'),
+        os.environ.get('JIRA_PASSWORD'),
+        plan=plan
+    )
 
 
 if __name__ == "__main__":
@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 
 import json
-import glob
 import os
 
+from issue_store import IssueStore
+
 
 def main():
 
@@ -13,15 +14,11 @@ def main():
         with open(dfn, 'r') as f:
             lmap = json.loads(f.read())
 
-    issue_fns = glob.glob('data/github/*/*/*_issue.json')
-    issue_fs = sorted(issue_fns)
-
-    logins = set()
-
-    for ifn in issue_fns:
-        with open(ifn, 'r') as f:
-            idata = json.loads(f.read())
-        logins.add(idata['user']['login'])
+    # everyone who opened or commented on an issue, jira_tickets.py
+    # looks each of them up in jira once and caches the result
+    store = IssueStore()
+    store.import_tree()
+    logins = store.authors(comments=True)
     
     newlmap = dict(zip(logins, [""] * len(list(logins))))
     for k,v in newlmap.items():
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+"""
+metrics.py - in-process counters and latency histograms for the crawler and the browser steps
+
+Everything records into one process wide registry. At the end of each phase (crawl,
+jira scrape, migration, close) the scripts export a snapshot of it to
+data/metrics/<phase>.prom in the prometheus text format (for the node_exporter
+textfile collector) and to data/metrics/<phase>.json.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+from logzero import logger
+
+
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join('data', 'metrics'))
+
+# seconds, from a fast api call up to a slow selenium step
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def endpoint(url):
+    '''The path of a url with the ids taken out, e.g. /repos/{owner}/{repo}/issues/{n}/comments'''
+    parts = [x for x in urlsplit(url).path.split('/') if x]
+    for idx, part in enumerate(parts):
+        if part.isdigit():
+            parts[idx] = '{n}'
+        elif idx > 0 and parts[idx - 1] == 'repos' and idx + 1 < len(parts):
+            parts[idx] = '{owner}'
+            parts[idx + 1] = '{repo}'
+        elif idx > 0 and parts[idx - 1] == 'issue' and '-' in part:
+            # jira keys like AA-123
+            parts[idx] = '{key}'
+    return '/' + '/'.join(parts)
+
+
+class Metrics(object):
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist['buckets'][idx] += 1
+                    break
+            hist['sum'] += value
+            hist['count'] += 1
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - started, **labels)
+
+    def snapshot(self):
+        with self.lock:
+            counters = [
+                {'name': k[0], 'labels': dict(k[1]), 'value': v}
+                for k, v in sorted(self.counters.items())
+            ]
+            histograms = []
+            for k, v in sorted(self.histograms.items()):
+                histograms.append({
+                    'name': k[0],
+                    'labels': dict(k[1]),
+                    'buckets': dict(zip([str(x) for x in self.buckets], v['buckets'])),
+                    'sum': v['sum'],
+                    'count': v['count']
+                })
+        return {'counters': counters, 'histograms': histograms}
+
+    @staticmethod
+    def _labels(labels, **extra):
+        labels = dict(labels, **extra)
+        if not labels:
+            return ''
+        pairs = []
+        for k, v in labels.items():
+            v = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            pairs.append(f'{k}="{v}"')
+        return '{' + ','.join(pairs) + '}'
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for counter in snapshot['counters']:
+            if counter['name'] not in typed:
+                lines.append(f"# TYPE {counter['name']} counter")
+                typed.add(counter['name'])
+            lines.append(f"{counter['name']}{self._labels(counter['labels'])} {counter['value']}")
+        for hist in snapshot['histograms']:
+            name = hist['name']
+            if name not in typed:
+                lines.append(f'# TYPE {name} histogram')
+                typed.add(name)
+            # prometheus buckets are cumulative
+            total = 0
+            for bound, count in hist['buckets'].items():
+                total += count
+                lines.append(f"{name}_bucket{self._labels(hist['labels'], le=bound)} {total}")
+            lines.append(f"{name}_bucket{self._labels(hist['labels'], le='+Inf')} {hist['count']}")
+            lines.append(f"{name}_sum{self._labels(hist['labels'])} {hist['sum']}")
+            lines.append(f"{name}_count{self._labels(hist['labels'])} {hist['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def export(self, phase, directory=None):
+        '''Write <phase>.prom and <phase>.json, atomically so a collector never reads half a file'''
+        directory = directory or METRICS_DIR
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        outputs = [
+            (f'{phase}.prom', self.to_prometheus()),
+            (f'{phase}.json', json.dumps(dict(self.snapshot(), phase=phase, exported_at=time.time()), indent=2))
+        ]
+        for fn, data in outputs:
+            fn = os.path.join(directory, fn)
+            with open(fn + '.tmp', 'w') as f:
+                f.write(data)
+            os.replace(fn + '.tmp', fn)
+        logger.info(f'exported {phase} metrics to {directory}')
+
+
+REGISTRY = Metrics()
+
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+export = REGISTRY.export
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+"""
+migration_journal.py - an append-only journal of the migration progress
+
+Every ticket created, comment posted, issue finished and github issue closed is
+appended as one json line. On open the journal is replayed into memory, so resuming
+costs O(journal) and never touches the data tree. Writes are fsync'ed in batches and
+the file is rewritten from the in-memory state once it has grown well past it.
+A readonly journal only replays, it never creates, truncates or compacts the file.
+"""
+
+import json
+import os
+import threading
+import time
+
+from logzero import logger
+
+
+JOURNAL_FILE = 'data/jira/migration_journal.jsonl'
+
+EVENTS = ('issue_created', 'comment_posted', 'issue_done', 'ticket_closed')
+
+
+class MigrationJournal(object):
+
+    # how many records go by between checks for compaction
+    COMPACT_CHECK_EVERY = 1000
+
+    def __init__(self, fn=JOURNAL_FILE, batch_size=20, batch_seconds=2.0, compact_ratio=4, readonly=False):
+        self.fn = fn
+        self.readonly = readonly
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self.compact_ratio = compact_ratio
+        self.lock = threading.Lock()
+
+        # github issue url -> jira key
+        self.issues = {}
+        # jira key -> github comment urls
+        self.comments = {}
+        # github issue urls
+        self.done = set()
+        self.closed = set()
+
+        self.lines = 0
+        self.pending = 0
+        self.last_sync = time.time()
+
+        self.f = None
+        self.existed = os.path.exists(fn)
+        self.replay()
+        if readonly:
+            return
+
+        dn = os.path.dirname(fn)
+        if dn and not os.path.exists(dn):
+            os.makedirs(dn)
+        if self.needs_compaction():
+            self.compact()
+        self.f = open(self.fn, 'a')
+
+    def _apply(self, event):
+        etype = event['event']
+        if etype == 'issue_created':
+            self.issues[event['github_url']] = event['jira_key']
+        elif etype == 'comment_posted':
+            self.comments.setdefault(event['jira_key'], set()).add(event['comment_url'])
+        elif etype == 'issue_done':
+            if event.get('jira_key'):
+                self.issues.setdefault(event['github_url'], event['jira_key'])
+            self.done.add(event['github_url'])
+        elif etype == 'ticket_closed':
+            self.closed.add(event['github_url'])
+
+    def replay(self):
+        if not self.existed:
+            return
+        offset = 0
+        with open(self.fn, 'rb') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    event = None
+                if event is None or not line.endswith(b'\n'):
+                    # a torn write from a crash can only be the last line,
+                    # cut it off so new events do not get glued onto it
+                    logger.warning(f'dropping a partial line at the end of {self.fn}')
+                    break
+                self._apply(event)
+                self.lines += 1
+                offset += len(line)
+        if offset != os.path.getsize(self.fn) and not self.readonly:
+            with open(self.fn, 'r+b') as f:
+                f.truncate(offset)
+
+    def _state_size(self):
+        return len(self.issues) + sum(len(x) for x in self.comments.values()) + len(self.done) + len(self.closed)
+
+    def needs_compaction(self):
+        return self.lines > self.compact_ratio * self._state_size() + 100
+
+    def _snapshot(self):
+        for github_url, jira_key in self.issues.items():
+            yield {'event': 'issue_created', 'github_url': github_url, 'jira_key': jira_key}
+        for jira_key, urls in self.comments.items():
+            for url in sorted(urls):
+                yield {'event': 'comment_posted', 'jira_key': jira_key, 'comment_url': url}
+        for github_url in self.done:
+            yield {'event': 'issue_done', 'github_url': github_url, 'jira_key': self.issues.get(github_url)}
+        for github_url in self.closed:
+            yield {'event': 'ticket_closed', 'github_url': github_url, 'jira_key': self.issues.get(github_url)}
+
+    def compact(self):
+        '''Rewrite the journal as the minimal set of events for the current state'''
+        tmpfn = self.fn + '.tmp'
+        lines = 0
+        with open(tmpfn, 'w') as f:
+            for event in self._snapshot():
+                f.write(json.dumps(event) + '\n')
+                lines += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmpfn, self.fn)
+        logger.info(f'compacted {self.fn} from {self.lines} to {lines} events')
+        self.lines = lines
+
+    def record(self, etype, **fields):
+        if etype not in EVENTS:
+            raise Exception(f'unknown journal event {etype}')
+        if self.readonly:
+            raise Exception(f'{self.fn} was opened readonly')
+        event = dict(fields, event=etype)
+        with self.lock:
+            self._apply(event)
+            self.f.write(json.dumps(event) + '\n')
+            self.lines += 1
+            self.pending += 1
+            if self.pending >= self.batch_size or time.time() - self.last_sync >= self.batch_seconds:
+                self._sync()
+            if self.lines % self.COMPACT_CHECK_EVERY == 0 and self.needs_compaction():
+                self._sync()
+                self.f.close()
+                self.compact()
+                self.f = open(self.fn, 'a')
+
+    def _sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.pending = 0
+        self.last_sync = time.time()
+
+    def sync(self):
+        with self.lock:
+            if self.f is not None:
+                self._sync()
+
+    def close(self):
+        with self.lock:
+            if self.f is None:
+                return
+            self._sync()
+            self.f.close()
+            if self.needs_compaction():
+                self.compact()
+
+    def issue_created(self, github_url, jira_key):
+        self.record('issue_created', github_url=github_url, jira_key=jira_key)
+
+    def comment_posted(self, jira_key, comment_url):
+        self.record('comment_posted', jira_key=jira_key, comment_url=comment_url)
+
+    def issue_done(self, github_url, jira_key):
+        self.record('issue_done', github_url=github_url, jira_key=jira_key)
+
+    def ticket_closed(self, github_url, jira_key):
+        self.record('ticket_closed', github_url=github_url, jira_key=jira_key)
+
+    def is_done(self, github_url):
+        with self.lock:
+            return github_url in self.done
+
+    def posted_comments(self):
+        with self.lock:
+            return dict((k, set(v)) for k, v in self.comments.items())
+
+    def is_closed(self, github_url):
+        with self.lock:
+            return github_url in self.closed
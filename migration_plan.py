@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""
+migration_plan.py - work out what a migration run has to do without a browser
+
+The plan is computed purely from the local github data (issue_store), the cached
+jira snapshot (the github url and comment indexes saved by jira_tickets.py) and
+the migration journal. It lists the tickets to create, the comments to add and
+the github issues to close. jira_tickets.py only starts firefox if there is
+something to create or comment on.
+"""
+
+import json
+import os
+import time
+
+from logzero import logger
+
+from issue_store import MIGRATE_LABEL, IssueStore, repo_from_url
+from jira_index import CommentIndex, JiraIndex
+from migration_journal import MigrationJournal
+
+
+DATA_DIR = 'data'
+PLAN_FILE = os.path.join(DATA_DIR, 'jira', 'plan.json')
+
+
+def github_issue_from_url(github_url):
+    '''https://github.com/<org>/<repo>/issues/<n> -> (<org>/<repo>, n)'''
+    parts = github_url.rstrip('/').split('/')
+    try:
+        return ('/'.join(parts[3:5]), int(parts[-1]))
+    except ValueError:
+        return (None, None)
+
+
+def build_plan(store, jira_index, comment_index, journal, label=MIGRATE_LABEL):
+    plan = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'create': [],
+        'comment': [],
+        'close': []
+    }
+
+    posted = journal.posted_comments()
+
+    for created_at, repository_url, number, path in store.issues_with_label(label):
+        repo = repo_from_url(repository_url)
+        idata = store.get_issue(repo, number)
+        cdata = store.get_comments(repo, number) or []
+        if not isinstance(cdata, list):
+            cdata = []
+
+        entry = {
+            'created_at': created_at,
+            'repository_url': repository_url,
+            'number': number,
+            'github_url': idata['html_url']
+        }
+
+        ticket = jira_index.get(idata['html_url'])
+        if not ticket:
+            entry['comments'] = len(cdata)
+            plan['create'].append(entry)
+            continue
+
+        key = ticket['number']
+        missing = [
+            x['html_url'] for x in cdata
+            if not comment_index.has(key, x['html_url']) and x['html_url'] not in posted.get(key, ())
+        ]
+        if missing:
+            entry['jira_key'] = key
+            entry['comments'] = missing
+            plan['comment'].append(entry)
+
+    for ticket in jira_index.records():
+        if journal.is_closed(ticket['github_link']):
+            continue
+        repo, number = github_issue_from_url(ticket['github_link'])
+        idata = store.get_issue(repo, number) if repo else None
+        if idata is not None and idata.get('state') != 'open':
+            continue
+        plan['close'].append({
+            'github_url': ticket['github_link'],
+            'jira_key': ticket['number'],
+            'jira_url': ticket['url'],
+            'state': idata.get('state') if idata else None
+        })
+
+    return plan
+
+
+def make_plan(data_dir=DATA_DIR, label=MIGRATE_LABEL):
+    jira_dir = os.path.join(data_dir, 'jira')
+    store = IssueStore(os.path.join(data_dir, 'github', 'issues.sqlite'))
+    store.import_tree(os.path.join(data_dir, 'github'))
+    # readonly, so the journal file is not created here before jira_tickets.py
+    # had a chance to carry the lockfiles of older runs over into it
+    journal = MigrationJournal(os.path.join(jira_dir, 'migration_journal.jsonl'), readonly=True)
+    index_fn = os.path.join(jira_dir, 'AA_jira_index.json')
+    if not os.path.exists(index_fn):
+        logger.warning(f'{index_fn} not found, every labelled issue is planned as a ticket to create')
+    try:
+        return build_plan(
+            store,
+            JiraIndex.load(index_fn),
+            CommentIndex.load(os.path.join(jira_dir, 'AA_comment_index.json')),
+            journal,
+            label=label
+        )
+    finally:
+        journal.close()
+        store.close()
+
+
+def is_empty(plan, steps=('create', 'comment')):
+    return not any(plan[x] for x in steps)
+
+
+def summarize(plan):
+    return ', '.join(f'{len(plan[x])} to {x}' for x in ('create', 'comment', 'close'))
+
+
+def save_plan(plan, fn=PLAN_FILE):
+    dn = os.path.dirname(fn)
+    if dn and not os.path.exists(dn):
+        os.makedirs(dn)
+    with open(fn, 'w') as f:
+        f.write(json.dumps(plan, indent=2, sort_keys=True))
+    logger.info(f'wrote plan to {fn}: {summarize(plan)}')
+
+
+def load_plan(fn=PLAN_FILE):
+    with open(fn, 'r') as f:
+        return json.loads(f.read())
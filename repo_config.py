@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+"""
+repo_config.py - which github repos get migrated, and how
+
+repos.json lists single repos and whole orgs, together with whether their issues are
+private (tickets get the internal security level) and which jira component they map
+to, e.g.
+
+    {
+        "workers": 4,
+        "request_budget": null,
+        "orgs": [
+            {"name": "RedHatInsights", "include": ["tower-analytics-*"], "component": null}
+        ],
+        "repos": [
+            {"name": "RedHatInsights/tower-analytics-backend", "private": true, "component": "API"}
+        ]
+    }
+
+Org entries are expanded through the org repos endpoint when github_tickets.py runs
+(archived repos and repos without issues are skipped). A repo that is also listed on
+its own uses the settings of that entry, and a private setting of null takes the
+visibility of the repo on github. The expanded list is saved to data/github/repos.json
+so jira_tickets.py can look the settings up without talking to github. A repo whose
+visibility could not be found out is treated as private.
+"""
+
+import fnmatch
+import json
+import os
+
+from logzero import logger
+
+
+CONFIG_FILE = os.environ.get('MIGRATION_CONFIG', 'repos.json')
+RESOLVED_FILE = os.path.join('data', 'github', 'repos.json')
+
+API_URL = 'https://api.github.com/repos/'
+
+
+class RepoConfig(object):
+
+    def __init__(self, config, resolved=None):
+        self.config = config
+        self.workers = config.get('workers') or 1
+        self.request_budget = config.get('request_budget')
+        # <org>/<repo> -> {name, private, component}
+        self.repos = {}
+        for repo in resolved or []:
+            self.repos[repo['name'].lower()] = repo
+        for repo in config.get('repos', []):
+            # the config wins, except for a null private that resolve() already looked up
+            merged = dict(self.repos.get(repo['name'].lower(), {}))
+            merged.update((k, v) for k, v in repo.items() if k != 'private' or v is not None)
+            merged.setdefault('private', None)
+            self.repos[repo['name'].lower()] = merged
+
+    @classmethod
+    def load(cls, fn=CONFIG_FILE, resolved_fn=RESOLVED_FILE):
+        if not os.path.exists(fn):
+            raise Exception(f'{fn} not found, it lists the repos to migrate (see repo_config.py)')
+        with open(fn, 'r') as f:
+            config = json.loads(f.read())
+        resolved = None
+        if resolved_fn and os.path.exists(resolved_fn):
+            with open(resolved_fn, 'r') as f:
+                resolved = json.loads(f.read())
+        return cls(config, resolved=resolved)
+
+    def resolve(self, ghc, fn=RESOLVED_FILE):
+        '''Expand the orgs into their repos and save the full list'''
+        # start over from the config, so a visibility change on github is picked up
+        repos = dict((x['name'].lower(), dict(x)) for x in self.config.get('repos', []))
+        for org in self.config.get('orgs', []):
+            (rr, listing) = ghc._geturl(
+                f"https://api.github.com/orgs/{org['name']}/repos?type=all",
+                conditional=False
+            )
+            if rr.status_code != 200 or not isinstance(listing, list):
+                logger.error(f"could not list the repos of {org['name']}: {rr.status_code}")
+                continue
+            for grepo in listing:
+                name = grepo['full_name'].lower()
+                if grepo.get('archived') or not grepo.get('has_issues', True):
+                    continue
+                if not any(fnmatch.fnmatch(grepo['name'], x) for x in org.get('include', ['*'])):
+                    continue
+                if any(fnmatch.fnmatch(grepo['name'], x) for x in org.get('exclude', [])):
+                    continue
+                if name in repos:
+                    if repos[name].get('private') is None:
+                        repos[name]['private'] = grepo.get('private', False)
+                    continue
+                repos[name] = {
+                    'name': grepo['full_name'],
+                    'private': grepo.get('private', False) if org.get('private') is None else org['private'],
+                    'component': org.get('component')
+                }
+
+        # listed repos without a privacy setting outside of any listed org
+        for repo in repos.values():
+            if repo.get('private') is None:
+                (rr, grepo) = ghc._geturl(API_URL + repo['name'], conditional=False, follow=False)
+                if rr.status_code == 200 and isinstance(grepo, dict) and 'private' in grepo:
+                    repo['private'] = grepo['private']
+                else:
+                    logger.warning(f"could not look up the visibility of {repo['name']}, treating it as private")
+                    repo['private'] = True
+        self.repos = repos
+
+        dn = os.path.dirname(fn)
+        if dn and not os.path.exists(dn):
+            os.makedirs(dn)
+        with open(fn + '.tmp', 'w') as f:
+            f.write(json.dumps(sorted(repos.values(), key=lambda x: x['name'].lower()), indent=2))
+        os.replace(fn + '.tmp', fn)
+        logger.info(f'{len(repos)} repos to crawl')
+        return self.names()
+
+    def names(self):
+        '''The [<org>, <repo>] of every configured (and resolved) repo'''
+        return [self.repos[x]['name'].split('/') for x in sorted(self.repos)]
+
+    def get(self, repository_url):
+        '''The settings of a repo by its api url (the repository_url of its issues)'''
+        name = repository_url.rstrip('/')
+        if name.startswith(API_URL):
+            name = name[len(API_URL):]
+        return self.repos.get(name.lower(), {})
+
+    def private(self, repository_url):
+        '''Only repos known to be public are, anything unknown is treated as private'''
+        return self.get(repository_url).get('private') is not False
+
+    def component(self, repository_url):
+        return self.get(repository_url).get('component')
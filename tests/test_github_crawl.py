@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""
+test_github_crawl.py - crawl_one against an in-memory github, cut short by the request budget
+
+    python -m unittest discover tests
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest import mock
+from urllib.parse import urlsplit
+
+import requests
+
+import github_tickets
+
+from github_tickets import GHCrawler, RequestBudgetExhausted, SyncState, crawl_one
+from issue_store import IssueStore
+
+
+REPO_URL = 'https://api.github.com/repos/o/r'
+
+
+class FakeGithubCrawler(GHCrawler):
+
+    '''A crawler whose requests are answered from a dict of path -> json instead of github'''
+
+    def __init__(self, pages, **kwargs):
+        super(FakeGithubCrawler, self).__init__(['token'], workers=1, **kwargs)
+        self.pages = pages
+        self.paths = []
+
+    def call_requests(self, url, headers, revalidate=True):
+        path = urlsplit(url).path
+        self.paths.append(path)
+        rr = requests.Response()
+        rr.url = url
+        if path in self.pages:
+            rr.status_code = 200
+            rr.reason = 'OK'
+            rr._content = json.dumps(self.pages[path]).encode('utf-8')
+        else:
+            rr.status_code = 404
+            rr.reason = 'Not Found'
+            rr._content = b'{"message": "Not Found"}'
+        return rr
+
+
+def github(comments, updated_at):
+    '''Three issues with the given number of comments each'''
+    pages = {'/repos/o/r/issues': []}
+    for number in (1, 2, 3):
+        comments_url = f'{REPO_URL}/issues/{number}/comments'
+        pages['/repos/o/r/issues'].append({
+            'number': number,
+            'title': f'issue {number}',
+            'labels': [{'name': 'JIRA'}],
+            'user': {'login': 'jdoe'},
+            'state': 'open',
+            'created_at': '2020-01-01T00:00:00Z',
+            'updated_at': updated_at,
+            'comments': comments,
+            'comments_url': comments_url,
+            'repository_url': REPO_URL,
+            'html_url': f'https://github.com/o/r/issues/{number}'
+        })
+        pages[urlsplit(comments_url).path] = [
+            {
+                'html_url': f'https://github.com/o/r/issues/{number}#issuecomment-{number}{idc}',
+                'user': {'login': 'jdoe'},
+                'body': f'comment {idc}'
+            }
+            for idc in range(comments)
+        ]
+    return pages
+
+
+class TestCrawlBudget(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        patcher = mock.patch.object(github_tickets, 'DATA_DIR', self.tmpdir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = IssueStore(os.path.join(self.tmpdir, 'issues.sqlite'))
+        self.state_fn = os.path.join(self.tmpdir, '.sync_state.json')
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmpdir)
+
+    def crawl(self, pages, request_budget=None):
+        ghc = FakeGithubCrawler(pages, state=SyncState(self.state_fn), request_budget=request_budget)
+        try:
+            crawl_one(ghc, self.store, ['o', 'r'])
+        finally:
+            ghc.page_pool.shutdown()
+        return ghc
+
+    def comment_files(self):
+        counts = {}
+        for number in (1, 2, 3):
+            with open(os.path.join(self.tmpdir, 'o', 'r', f'{number}_comments.json'), 'r') as f:
+                counts[number] = len(json.loads(f.read()))
+        return counts
+
+    @staticmethod
+    def comment_requests(ghc):
+        return [x for x in ghc.paths if x.endswith('/comments')]
+
+    def test_rerun_after_budget(self):
+        ghc = self.crawl(github(1, '2020-01-02T00:00:00Z'))
+        self.assertEqual(len(self.comment_requests(ghc)), 3)
+        self.assertEqual(self.comment_files(), {1: 1, 2: 1, 3: 1})
+
+        # every issue got a comment, the budget covers the listing and one of them
+        changed = github(2, '2020-01-03T00:00:00Z')
+        with self.assertRaises(RequestBudgetExhausted):
+            self.crawl(changed, request_budget=2)
+        self.assertEqual(self.comment_files(), {1: 2, 2: 1, 3: 1})
+        # an issue is only saved once its comments are
+        self.assertEqual(self.store.get_issue('o/r', 1)['comments'], 2)
+        self.assertEqual(self.store.get_issue('o/r', 2)['comments'], 1)
+
+        # the rerun fetches the comments it did not get to, and only those
+        ghc = self.crawl(changed)
+        self.assertEqual(self.comment_requests(ghc), ['/repos/o/r/issues/2/comments', '/repos/o/r/issues/3/comments'])
+        self.assertEqual(self.comment_files(), {1: 2, 2: 2, 3: 2})
+        self.assertEqual(ghc.state.get_watermark('o/r'), '2020-01-03T00:00:00Z')
+
+        # and once everything is in sync nothing is fetched again
+        ghc = self.crawl(changed)
+        self.assertEqual(self.comment_requests(ghc), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
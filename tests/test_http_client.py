@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+"""
+test_http_client.py - which failures the shared client retries
+
+    python -m unittest discover tests
+"""
+
+import unittest
+
+from unittest import mock
+
+import requests
+
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from http_client import HTTPClient, HTTPRetriesExhausted
+
+
+def refused():
+    reason = NewConnectionError(None, 'connection refused')
+    return requests.exceptions.ConnectionError(MaxRetryError(None, 'http://jira/', reason))
+
+
+class TestRetries(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('http_client.time.sleep')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = HTTPClient(retries=3)
+
+    def send(self, method, error):
+        with mock.patch.object(self.client.session, 'request', side_effect=error) as request:
+            with self.assertRaises((HTTPRetriesExhausted, type(error))):
+                self.client.request(method, 'http://jira/rest/api/2/issue')
+        return request.call_count
+
+    def test_read_timeout_post_is_not_resent(self):
+        self.assertEqual(self.send('POST', requests.exceptions.ReadTimeout()), 1)
+
+    def test_reset_post_is_not_resent(self):
+        self.assertEqual(self.send('POST', requests.exceptions.ConnectionError('connection reset')), 1)
+
+    def test_connect_failures_post_is_retried(self):
+        self.assertEqual(self.send('POST', requests.exceptions.ConnectTimeout()), 3)
+        self.assertEqual(self.send('POST', refused()), 3)
+
+    def test_read_timeout_get_is_retried(self):
+        self.assertEqual(self.send('GET', requests.exceptions.ReadTimeout()), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
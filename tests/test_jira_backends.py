@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+"""
+test_jira_backends.py - the rest backend against a fake jira on localhost
+
+    python -m unittest discover tests
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+from urllib.parse import urlsplit
+
+import jira_tickets
+
+from http_client import HTTPClient
+from jira_backends import COMMENT_SECURITY_LEVEL, SECURITY_LEVEL, RestBackend
+from jira_index import CommentIndex, JiraIndex
+from jira_rest import JiraREST
+from migration_journal import MigrationJournal
+from repo_config import RepoConfig
+from user_cache import UserCache
+
+
+EPIC_NAME_FIELD = 'customfield_12311141'
+
+PRIVATE_REPO = 'https://api.github.com/repos/RedHatInsights/tower-analytics-backend'
+PUBLIC_REPO = 'https://api.github.com/repos/RedHatInsights/tower-analytics-frontend'
+
+
+class FakeJira(BaseHTTPRequestHandler):
+
+    '''Answers the few rest endpoints the backend uses and records every request'''
+
+    def log_message(self, *args):
+        pass
+
+    def _record(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self.server.requests.append({
+            'method': self.command,
+            'path': self.path,
+            'headers': dict(self.headers),
+            'json': json.loads(body) if body else None
+        })
+
+    def _reply(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._record()
+        path = urlsplit(self.path).path
+        if path == '/rest/api/2/field':
+            self._reply(200, [
+                {'id': 'summary', 'name': 'Summary'},
+                {'id': EPIC_NAME_FIELD, 'name': 'Epic Name'}
+            ])
+        elif path.startswith('/rest/api/2/issue/') and path.endswith('/comment'):
+            comments = self.server.comments.get(path.split('/')[-2], [])
+            self._reply(200, {'startAt': 0, 'maxResults': 100, 'total': len(comments), 'comments': comments})
+        else:
+            self._reply(404, {'errorMessages': ['not found']})
+
+    def do_POST(self):
+        self._record()
+        if self.path == '/rest/api/2/issue':
+            self.server.created += 1
+            key = f'AA-{self.server.created}'
+            self._reply(201, {'id': str(self.server.created), 'key': key, 'self': self.server.url + '/rest/api/2/issue/' + key})
+        elif self.path.startswith('/rest/api/2/issue/') and self.path.endswith('/comment'):
+            comment = {'id': str(len(self.server.requests)), 'body': self.server.requests[-1]['json']['body']}
+            self.server.comments.setdefault(self.path.split('/')[-2], []).append(comment)
+            self._reply(201, comment)
+        else:
+            self._reply(404, {'errorMessages': ['not found']})
+
+
+def issue(number, repository_url=PUBLIC_REPO, login='jdoe'):
+    name = repository_url.split('/repos/')[1]
+    return {
+        'number': number,
+        'title': f'issue {number}',
+        'body': 'something is broken',
+        'html_url': f'https://github.com/{name}/issues/{number}',
+        'repository_url': repository_url,
+        'user': {'login': login}
+    }
+
+
+def comment(html_url, idc):
+    return {
+        'html_url': f'{html_url}#issuecomment-{idc}',
+        'created_at': '2020-01-01T00:00:00Z',
+        'user': {'login': 'jdoe'},
+        'body': f'comment {idc}'
+    }
+
+
+class TestRestBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), FakeJira)
+        self.server.requests = []
+        self.server.created = 0
+        self.server.comments = {}
+        self.server.url = f'http://127.0.0.1:{self.server.server_port}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        self.tmpdir = tempfile.mkdtemp()
+        patcher = mock.patch.object(jira_tickets, 'DATA_DIR', self.tmpdir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # a wrapper with just the state the backend reads, no browser behind it
+        wrapper = jira_tickets.JiraWrapper.__new__(jira_tickets.JiraWrapper)
+        wrapper.rest = JiraREST(self.server.url, client=HTTPClient(retries=1))
+        wrapper.repo_config = RepoConfig({'repos': [
+            {'name': 'RedHatInsights/tower-analytics-backend', 'private': True, 'component': 'API'},
+            {'name': 'RedHatInsights/tower-analytics-frontend', 'private': False, 'component': 'UI'}
+        ]})
+        wrapper.users = UserCache(os.path.join(self.tmpdir, 'user_cache.json'))
+        wrapper.users.users = {'jdoe': {'query': 'jdoe', 'name': 'john.doe', 'key': 'jdoe', 'display': 'John Doe'}}
+        wrapper.jira_issues = []
+        wrapper.jira_index = JiraIndex()
+        wrapper.comment_index = CommentIndex()
+        wrapper.journal = MigrationJournal(os.path.join(self.tmpdir, 'migration_journal.jsonl'))
+        wrapper.jira_lock = threading.Lock()
+        wrapper.backend = RestBackend(wrapper)
+        self.wrapper = wrapper
+        self.backend = wrapper.backend
+
+    def tearDown(self):
+        self.wrapper.journal.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def posts(self, path=None):
+        return [
+            x for x in self.server.requests
+            if x['method'] == 'POST' and (path is None or x['path'] == path)
+        ]
+
+    def test_create_issue_fields(self):
+        idata = issue(1)
+        ticket = self.backend.create_issue(idata, private=False, itype='Bug')
+
+        self.assertEqual(ticket['number'], 'AA-1')
+        self.assertEqual(ticket['github_link'], idata['html_url'])
+        self.assertEqual(self.wrapper.jira_index.get(idata['html_url'])['number'], 'AA-1')
+
+        [post] = self.posts('/rest/api/2/issue')
+        fields = post['json']['fields']
+        self.assertEqual(fields['project'], {'key': 'AA'})
+        self.assertEqual(fields['issuetype'], {'name': 'Bug'})
+        self.assertEqual(fields['summary'], 'UI-1: issue 1')
+        self.assertTrue(fields['description'].startswith(idata['html_url']))
+        self.assertEqual(fields['components'], [{'name': 'UI'}])
+        self.assertEqual(fields['reporter'], {'name': 'john.doe'})
+        self.assertNotIn('security', fields)
+        self.assertNotIn(EPIC_NAME_FIELD, fields)
+        self.assertEqual(post['headers'].get('X-Atlassian-Token'), 'no-check')
+
+    def test_create_private_epic(self):
+        idata = issue(2, repository_url=PRIVATE_REPO, login='nobody')
+        self.backend.create_issue(idata, private=True, itype='Epic')
+
+        [post] = self.posts('/rest/api/2/issue')
+        fields = post['json']['fields']
+        self.assertEqual(fields['issuetype'], {'name': 'Epic'})
+        self.assertEqual(fields['security'], {'name': SECURITY_LEVEL})
+        self.assertEqual(fields['components'], [{'name': 'API'}])
+        # the epic name is a custom field, looked up by its display name
+        self.assertEqual(fields[EPIC_NAME_FIELD], fields['summary'])
+        # an author without a jira user leaves the reporter to jira
+        self.assertNotIn('reporter', fields)
+
+    def test_create_comments(self):
+        idata = issue(3, repository_url=PRIVATE_REPO)
+        ticket = self.backend.create_issue(idata, private=True)
+        cdata = [comment(idata['html_url'], x) for x in range(3)]
+
+        # the first one is on the ticket already
+        self.wrapper.comment_index.add(ticket['number'], cdata[0]['html_url'])
+        self.backend.create_comments(ticket, cdata, private=True)
+
+        posts = self.posts(f"/rest/api/2/issue/{ticket['number']}/comment")
+        self.assertEqual(len(posts), 2)
+        for post, cd in zip(posts, cdata[1:]):
+            self.assertTrue(post['json']['body'].startswith(cd['html_url']))
+            self.assertEqual(post['json']['visibility'], {'type': 'group', 'value': COMMENT_SECURITY_LEVEL})
+            self.assertEqual(post['headers'].get('X-Atlassian-Token'), 'no-check')
+            self.assertTrue(self.wrapper.comment_index.has(ticket['number'], cd['html_url']))
+        self.assertEqual(self.wrapper.journal.posted_comments()[ticket['number']], set(x['html_url'] for x in cdata[1:]))
+
+        # a rerun posts nothing
+        self.backend.create_comments(ticket, cdata, private=True)
+        self.assertEqual(len(self.posts(f"/rest/api/2/issue/{ticket['number']}/comment")), 2)
+
+    def test_refresh_comments(self):
+        idata = issue(5)
+        ticket = self.backend.create_issue(idata)
+        cdata = [comment(idata['html_url'], x) for x in range(2)]
+
+        # saved by a submit that looked like it failed, so the index missed it
+        self.wrapper.rest.post_json(
+            f"/rest/api/2/issue/{ticket['number']}/comment",
+            {'body': self.wrapper.comment_body(cdata[0])}
+        )
+        self.wrapper.refresh_comments(ticket)
+        self.assertTrue(self.wrapper.comment_index.has(ticket['number'], cdata[0]['html_url']))
+
+        self.backend.create_comments(ticket, cdata)
+        posts = self.posts(f"/rest/api/2/issue/{ticket['number']}/comment")
+        self.assertEqual([x['json']['body'] for x in posts], [self.wrapper.comment_body(x) for x in cdata])
+
+    def test_public_comments_have_no_visibility(self):
+        idata = issue(4)
+        ticket = self.backend.create_issue(idata)
+        self.backend.create_comments(ticket, [comment(idata['html_url'], 1)], private=False)
+
+        [post] = self.posts(f"/rest/api/2/issue/{ticket['number']}/comment")
+        self.assertNotIn('visibility', post['json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
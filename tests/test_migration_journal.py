@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""
+test_migration_journal.py - replaying, recovering and compacting the migration journal
+
+    python -m unittest discover tests
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from migration_journal import MigrationJournal
+
+
+GITHUB_URL = 'https://github.com/o/r/issues/{}'
+
+
+class TestMigrationJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.tmpdir, 'jira', 'migration_journal.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def lines(self):
+        with open(self.fn, 'r') as f:
+            return [json.loads(x) for x in f]
+
+    def write_some(self):
+        journal = MigrationJournal(self.fn)
+        journal.issue_created(GITHUB_URL.format(1), 'AA-1')
+        journal.comment_posted('AA-1', GITHUB_URL.format(1) + '#issuecomment-1')
+        journal.issue_done(GITHUB_URL.format(1), 'AA-1')
+        journal.ticket_closed(GITHUB_URL.format(1), 'AA-1')
+        journal.close()
+
+    def test_replay(self):
+        self.write_some()
+        journal = MigrationJournal(self.fn)
+        self.assertTrue(journal.existed)
+        self.assertTrue(journal.is_done(GITHUB_URL.format(1)))
+        self.assertTrue(journal.is_closed(GITHUB_URL.format(1)))
+        self.assertEqual(journal.posted_comments(), {'AA-1': {GITHUB_URL.format(1) + '#issuecomment-1'}})
+        self.assertFalse(journal.is_done(GITHUB_URL.format(2)))
+        journal.close()
+
+    def test_torn_last_line_is_cut_off(self):
+        self.write_some()
+        with open(self.fn, 'a') as f:
+            f.write('{"event": "issue_done", "github_url": "https://gi')
+        size = os.path.getsize(self.fn)
+
+        journal = MigrationJournal(self.fn)
+        self.assertLess(os.path.getsize(self.fn), size)
+        self.assertTrue(journal.is_done(GITHUB_URL.format(1)))
+
+        # new events start on a line of their own
+        journal.issue_done(GITHUB_URL.format(2), 'AA-2')
+        journal.close()
+        self.assertEqual(self.lines()[-1]['github_url'], GITHUB_URL.format(2))
+        self.assertTrue(MigrationJournal(self.fn, readonly=True).is_done(GITHUB_URL.format(2)))
+
+    def test_readonly_does_not_create(self):
+        journal = MigrationJournal(self.fn, readonly=True)
+        self.assertFalse(journal.existed)
+        journal.close()
+        self.assertFalse(os.path.exists(self.fn))
+        # so the journal opened for writing afterwards still knows it is new
+        self.assertFalse(MigrationJournal(self.fn).existed)
+
+    def test_readonly_replays_without_touching_the_file(self):
+        self.write_some()
+        with open(self.fn, 'a') as f:
+            f.write('{"torn')
+        size = os.path.getsize(self.fn)
+
+        journal = MigrationJournal(self.fn, readonly=True)
+        self.assertTrue(journal.is_done(GITHUB_URL.format(1)))
+        with self.assertRaises(Exception):
+            journal.issue_done(GITHUB_URL.format(2), 'AA-2')
+        journal.close()
+        self.assertEqual(os.path.getsize(self.fn), size)
+
+    def test_compaction(self):
+        journal = MigrationJournal(self.fn, compact_ratio=2)
+        # the same comment over and over only adds one piece of state
+        for x in range(300):
+            journal.comment_posted('AA-1', GITHUB_URL.format(1) + '#issuecomment-1')
+        journal.issue_done(GITHUB_URL.format(1), 'AA-1')
+        journal.close()
+
+        # the ticket, the comment and the issue being done
+        self.assertEqual([x['event'] for x in self.lines()], ['issue_created', 'comment_posted', 'issue_done'])
+        journal = MigrationJournal(self.fn)
+        self.assertTrue(journal.is_done(GITHUB_URL.format(1)))
+        self.assertEqual(journal.posted_comments(), {'AA-1': {GITHUB_URL.format(1) + '#issuecomment-1'}})
+        journal.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
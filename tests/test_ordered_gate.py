@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""
+test_ordered_gate.py - the gate that keeps ticket creation in order across sessions
+
+    python -m unittest discover tests
+"""
+
+import random
+import threading
+import time
+import unittest
+
+from jira_tickets import OrderedGate
+
+
+class TestOrderedGate(unittest.TestCase):
+
+    def waiter(self, gate, seq):
+        '''A thread blocked in gate.wait(seq), check is_alive() to see if it passed'''
+        thread = threading.Thread(target=gate.wait, args=(seq,), daemon=True)
+        thread.start()
+        return thread
+
+    def assertBlocked(self, thread):
+        thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+
+    def assertPassed(self, thread):
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+
+    def test_steps_pass_in_order(self):
+        gate = OrderedGate()
+        passed = []
+        lock = threading.Lock()
+
+        def _step(seq):
+            time.sleep(random.uniform(0, 0.01))
+            gate.wait(seq)
+            with lock:
+                passed.append(seq)
+            gate.done(seq)
+
+        threads = [threading.Thread(target=_step, args=(x,)) for x in reversed(range(20))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(passed, list(range(20)))
+
+    def test_early_finish_does_not_skip_earlier_steps(self):
+        gate = OrderedGate()
+        # e.g. an issue that was already done returns before it waits
+        gate.done(5)
+        thread = self.waiter(gate, 3)
+        self.assertBlocked(thread)
+
+        gate.done(0)
+        gate.done(2)
+        self.assertBlocked(thread)
+        gate.done(1)
+        self.assertPassed(thread)
+
+        # 5 is remembered, so 6 passes once 3 and 4 are done
+        thread = self.waiter(gate, 6)
+        gate.done(3)
+        self.assertBlocked(thread)
+        gate.done(4)
+        self.assertPassed(thread)
+        self.assertEqual(gate.next, 6)
+
+    def test_repeated_done_is_ignored(self):
+        gate = OrderedGate()
+        # migrate_issue calls done() again in its finally
+        gate.done(0)
+        gate.done(0)
+        self.assertEqual(gate.next, 1)
+        self.assertEqual(gate.finished, set())
+        self.assertBlocked(self.waiter(gate, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
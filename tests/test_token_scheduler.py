@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+"""
+test_token_scheduler.py - which github token a request goes out on
+
+    python -m unittest discover tests
+"""
+
+import time
+import unittest
+
+import requests
+
+from github_tickets import TokenScheduler
+
+
+def response(status=200, **headers):
+    rr = requests.Response()
+    rr.status_code = status
+    rr.headers.update(dict((k.replace('_', '-'), str(v)) for k, v in headers.items()))
+    return rr
+
+
+def spent(remaining, reset_in=3600):
+    return response(**{'X_RateLimit_Remaining': remaining, 'X_RateLimit_Reset': int(time.time() + reset_in)})
+
+
+class TestTokenScheduler(unittest.TestCase):
+
+    def test_needs_a_token(self):
+        with self.assertRaises(Exception):
+            TokenScheduler([])
+
+    def test_most_budget_wins(self):
+        scheduler = TokenScheduler(['a', 'b', 'c'])
+        for token, remaining in (('a', 100), ('b', 4000), ('c', 10)):
+            scheduler.tokens[token]['inflight'] += 1
+            scheduler.release(token, spent(remaining))
+        self.assertEqual(scheduler.acquire(), 'b')
+
+    def test_inflight_requests_count_against_the_budget(self):
+        scheduler = TokenScheduler(['a', 'b'])
+        scheduler.tokens['a']['inflight'] += 1
+        scheduler.release('a', spent(3))
+        scheduler.tokens['b']['inflight'] += 1
+        scheduler.release('b', spent(2))
+
+        self.assertEqual([scheduler.acquire() for x in range(4)], ['a', 'a', 'b', 'a'])
+        scheduler.release('b')
+        self.assertEqual(scheduler.acquire(), 'b')
+
+    def test_budget_comes_back_after_the_reset(self):
+        scheduler = TokenScheduler(['a', 'b'])
+        scheduler.tokens['a']['inflight'] += 1
+        scheduler.release('a', spent(0, reset_in=-10))
+        scheduler.tokens['b']['inflight'] += 1
+        scheduler.release('b', spent(50))
+        self.assertEqual(scheduler.acquire(), 'a')
+
+    def test_retry_after_blocks_only_that_token(self):
+        scheduler = TokenScheduler(['a', 'b'])
+        scheduler.tokens['b']['inflight'] += 1
+        scheduler.release('b', spent(10))
+        self.assertEqual(scheduler.acquire(), 'a')
+        scheduler.release('a', response(403, Retry_After=60))
+
+        self.assertEqual(scheduler.acquire(), 'b')
+        self.assertGreater(scheduler.tokens['a']['blocked_until'], time.time() + 50)
+
+    def test_waits_while_every_token_is_blocked(self):
+        scheduler = TokenScheduler(['a'])
+        scheduler.acquire()
+        scheduler.release('a', response(429, Retry_After=0.5))
+
+        started = time.time()
+        self.assertEqual(scheduler.acquire(), 'a')
+        self.assertGreaterEqual(time.time() - started, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
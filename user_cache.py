@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""
+user_cache.py - which jira user each github login maps to, looked up once
+
+Each login that login_map.json maps to a jira username or email is resolved through
+the jira user picker, which has to match that exactly. Unmapped logins get no user,
+a github login says nothing about who owns the same name in jira. Misses are
+remembered too and only tried again once the login_map entry for them changes. The
+results are kept in data/jira/user_cache.json across runs.
+"""
+
+import json
+import os
+import time
+
+from logzero import logger
+
+
+USER_CACHE_FILE = os.path.join('data', 'jira', 'user_cache.json')
+
+
+class UserCache(object):
+
+    def __init__(self, fn=USER_CACHE_FILE):
+        self.fn = fn
+        # github login -> {query, name, key, display, checked_at}
+        self.users = {}
+        if os.path.exists(fn):
+            with open(fn, 'r') as f:
+                self.users = json.loads(f.read())
+
+    def save(self):
+        dn = os.path.dirname(self.fn)
+        if dn and not os.path.exists(dn):
+            os.makedirs(dn)
+        with open(self.fn + '.tmp', 'w') as f:
+            f.write(json.dumps(self.users, indent=2, sort_keys=True))
+        os.replace(self.fn + '.tmp', self.fn)
+
+    @staticmethod
+    def query_for(login, login_map):
+        return (login_map or {}).get(login) or None
+
+    def get(self, login):
+        '''The resolved jira user of a login, or None'''
+        entry = self.users.get(login)
+        if entry and entry.get('name'):
+            return entry
+        return None
+
+    def resolve(self, rest, logins, login_map=None):
+        '''Look up every login not resolved with its current query yet, returns the ones without a user'''
+        checked = 0
+        changed = False
+        for login in sorted(logins):
+            query = self.query_for(login, login_map)
+            entry = self.users.get(login)
+            # entries from before lookups had to match exactly are done again
+            if entry and entry['query'] == query and entry.get('exact'):
+                continue
+
+            user = None
+            if query:
+                try:
+                    user = rest.find_user(query)
+                except Exception as e:
+                    logger.error(f'looking up {query} for {login} failed: {e}')
+                    continue
+            self.users[login] = {
+                'query': query,
+                'exact': True,
+                'name': user['name'] if user else None,
+                'key': user.get('key') if user else None,
+                'display': user.get('displayName') if user else None,
+                'checked_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            }
+            changed = True
+            if query:
+                checked += 1
+
+        if changed:
+            self.save()
+        if checked:
+            logger.info(f'looked up {checked} github logins in jira')
+
+        missing = sorted(x for x in logins if not self.get(x))
+        if missing:
+            logger.warning(f'no jira user for {len(missing)} github logins: {", ".join(missing)}')
+        return missing
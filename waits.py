@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""
+waits.py - explicit, condition based waits for the selenium flows
+
+A Waiter polls a condition with a short interval that grows while the condition is
+not met, so fast pages are not slowed down by fixed sleeps and slow pages are not
+hammered. Every wait is timed per name so the slow steps show up in the stats.
+"""
+
+import time
+
+from logzero import logger
+from selenium.common.exceptions import StaleElementReferenceException, WebDriverException
+
+
+WAIT_SECONDS = 60
+
+
+class WaitTimeout(Exception):
+    pass
+
+
+def present(by, value):
+    def _condition(driver):
+        elements = driver.find_elements(by, value)
+        return elements[0] if elements else False
+    return _condition
+
+
+def visible(by, value):
+    def _condition(driver):
+        element = driver.find_element(by, value)
+        return element if element.is_displayed() else False
+    return _condition
+
+
+def invisible(by, value):
+    def _condition(driver):
+        return not any(x.is_displayed() for x in driver.find_elements(by, value))
+    return _condition
+
+
+def clickable(by, value):
+    def _condition(driver):
+        element = driver.find_element(by, value)
+        return element if element.is_displayed() and element.is_enabled() else False
+    return _condition
+
+
+def stale(element):
+    '''True once the element was removed from the page, e.g. by a form reload'''
+    def _condition(driver):
+        try:
+            element.is_enabled()
+        except StaleElementReferenceException:
+            return True
+        return False
+    return _condition
+
+
+def modal_closed():
+    return invisible('css selector', '.jira-dialog')
+
+
+def page_ready():
+    def _condition(driver):
+        return driver.execute_script('return document.readyState') == 'complete'
+    return _condition
+
+
+class Waiter(object):
+
+    def __init__(self, driver, timeout=WAIT_SECONDS, interval=0.05, max_interval=1.0, growth=1.5):
+        self.driver = driver
+        self.timeout = timeout
+        self.interval = interval
+        self.max_interval = max_interval
+        self.growth = growth
+        self.stats = {}
+
+    def _record(self, name, elapsed, timed_out=False):
+        stat = self.stats.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0, 'timeouts': 0})
+        stat['count'] += 1
+        stat['total'] += elapsed
+        stat['max'] = max(stat['max'], elapsed)
+        if timed_out:
+            stat['timeouts'] += 1
+
+    def until(self, condition, name, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.time()
+        interval = self.interval
+        while True:
+            try:
+                result = condition(self.driver)
+            except WebDriverException:
+                result = False
+
+            elapsed = time.time() - started
+            if result:
+                self._record(name, elapsed)
+                return result
+            if elapsed >= timeout:
+                self._record(name, elapsed, timed_out=True)
+                raise WaitTimeout(f'{name} not met after {elapsed:.1f}s')
+
+            time.sleep(min(interval, timeout - elapsed))
+            interval = min(interval * self.growth, self.max_interval)
+
+    def log_stats(self):
+        for name, stat in sorted(self.stats.items(), key=lambda x: -x[1]['total']):
+            logger.info(
+                f"wait {name}: {stat['count']} waits, {stat['total']:.1f}s total, "
+                f"{stat['max']:.1f}s max, {stat['timeouts']} timeouts"
+            )